@@ -0,0 +1,74 @@
+#!/usr/local/bin/python3
+# batch_solver.py : Solve many boards of the 2021 sliding tile puzzle in one run
+#
+# Boards are read from a file (or stdin when no file, or "-", is given) as whitespace separated numbers, 20 numbers
+# per board. They are spread over a pool of worker processes, each of which loads the heuristic tables once, and
+# one JSON line is printed per board as soon as it is solved:
+#   {"index": 0, "board": [...], "moves": ["R2", ...], "length": 3, "time": 0.002, "nodes": 17}
+#
+# Usage: python3 batch_solver.py [boards.txt] [--workers N] [--engine astar|ida|anytime|hda]
+#
+# Pool workers are daemonic and can't start processes of their own, so with --engine hda each board is solved with
+# serial A*; the boards themselves are already spread over the pool.
+
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+
+import solver2021
+
+def read_boards(file):
+    numbers = [int(i) for i in file.read().split()]
+    if len(numbers) % (solver2021.ROWS * solver2021.COLS) != 0:
+        raise(Exception("Error: expected " + str(solver2021.ROWS * solver2021.COLS) + " numbers per board"))
+    size = solver2021.ROWS * solver2021.COLS
+    return [numbers[i:i + size] for i in range(0, len(numbers), size)]
+
+# Runs once in every worker, so the pattern database and endgame table are mapped once per process instead of
+# being timed as part of its first board.
+def init_worker(engine):
+    if engine is not None:
+        solver2021.SEARCH_ENGINE = engine
+    solver2021.get_pattern_db()
+    solver2021.get_endgame_table()
+
+def solve_board(job):
+    (index, board) = job
+    start = time.time()
+    try:
+        (route, state_count) = solver2021.search(board)
+    except Exception as e:
+        return {"index": index, "board": board, "error": str(e)}
+    return {"index": index,
+            "board": board,
+            "moves": route,
+            "length": len(route),
+            "time": time.time() - start,
+            "nodes": state_count}
+
+# Yields the results in the order the boards finish. Missing tables are built here, before the pool starts, so the
+# workers only map finished files instead of racing to write the same ones.
+def solve_boards(boards, workers=None, engine=None):
+    solver2021.get_pattern_db()
+    solver2021.get_endgame_table()
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(engine,)) as pool:
+        for result in pool.imap_unordered(solve_board, enumerate(boards)):
+            yield result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve many boards and print one JSON line per board.")
+    parser.add_argument("boards", nargs="?", default="-", help="board file, or - for stdin")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--engine", choices=["astar", "ida", "anytime", "hda"], default=None)
+    args = parser.parse_args()
+
+    if args.boards == "-":
+        boards = read_boards(sys.stdin)
+    else:
+        with open(args.boards, "r") as file:
+            boards = read_boards(file)
+
+    for result in solve_boards(boards, args.workers, args.engine):
+        print(json.dumps(result), flush=True)
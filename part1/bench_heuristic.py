@@ -0,0 +1,49 @@
+#!/usr/local/bin/python3
+# bench_heuristic.py : Cost of scoring the successors of one node, pure Python vs NumPy
+#
+# Every A* expansion scores 9 successors. This times both ways of doing it on the same random boards and checks
+# that they agree.
+#
+# Usage: python3 bench_heuristic.py [number of boards]
+#
+
+import random
+import sys
+import time
+
+import solver2021
+
+def bench_python(boards):
+    start = time.perf_counter()
+    for tiles in boards:
+        heuristic_state = solver2021.get_heuristic_state(tiles)
+        [solver2021.get_successor_heuristic(heuristic_state, move) for move in solver2021.MOVES]
+    return (time.perf_counter() - start) / len(boards)
+
+def bench_numpy(boards):
+    start = time.perf_counter()
+    for tiles in boards:
+        solver2021.get_successor_scores_numpy(tiles)
+    return (time.perf_counter() - start) / len(boards)
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    random.seed(0)
+    boards = []
+    for _ in range(count):
+        board = list(range(1, solver2021.ROWS * solver2021.COLS + 1))
+        random.shuffle(board)
+        boards.append(tuple(board))
+
+    print("Boards: %d, pattern database: %s" % (count, "on" if solver2021.get_pattern_db() is not None else "off"))
+    print("Python: %8.2f us per expansion" % (bench_python(boards) * 1e6))
+    if solver2021.np is None:
+        print(" NumPy:      not installed")
+        sys.exit(0)
+
+    for tiles in boards[:1000]:
+        heuristic_state = solver2021.get_heuristic_state(tiles)
+        expected = [solver2021.get_successor_heuristic(heuristic_state, move) for move in solver2021.MOVES]
+        if solver2021.get_successor_scores_numpy(tiles) != expected:
+            raise(Exception("Error: NumPy scores differ from Python scores for " + str(tiles)))
+    print(" NumPy: %8.2f us per expansion" % (bench_numpy(boards) * 1e6))
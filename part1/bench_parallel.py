@@ -0,0 +1,43 @@
+#!/usr/local/bin/python3
+# bench_parallel.py : Speedup of the parallel (HDA*) engine over the serial A* solve()
+#
+# Solves a fixed set of scrambled boards with serial A* and with HDA* on 1, 2 and 4 (or the given) worker counts,
+# checks that every engine finds the same solution lengths, and prints the total time and speedup of each.
+#
+# Usage: python3 bench_parallel.py [workers ...]
+#
+
+import random
+import sys
+import time
+
+import parallel_solver
+import solver2021
+
+# Scrambles mix the legal moves and their inverses, so some boards need much longer solutions than the scramble.
+def get_boards(count=6, scramble=5, seed=2021):
+    random.seed(seed)
+    names = solver2021.MOVE_NAMES + [solver2021.INVERSE_DIRECTION[move[0]] + move[1:] for move in solver2021.MOVE_NAMES]
+    goal = list(range(1, solver2021.ROWS * solver2021.COLS + 1))
+    return [solver2021.make_moves(goal, " ".join(random.choice(names) for _ in range(scramble)))
+            for _ in range(count)]
+
+def run(boards, solve):
+    start = time.perf_counter()
+    lengths = [len(solve(solver2021.pack_board(board))[0]) for board in boards]
+    return (time.perf_counter() - start, lengths)
+
+if __name__ == "__main__":
+    worker_counts = [int(i) for i in sys.argv[1:]] or [1, 2, 4]
+    boards = get_boards()
+    solver2021.get_pattern_db()
+    solver2021.get_endgame_table()
+
+    (serial_time, serial_lengths) = run(boards, solver2021.solve_astar)
+    print("Boards: %d, solution lengths: %s" % (len(boards), serial_lengths))
+    print("serial A*    %8.3fs" % serial_time)
+    for workers in worker_counts:
+        (hda_time, lengths) = run(boards, lambda board: parallel_solver.solve_hda(board, workers))
+        if lengths != serial_lengths:
+            raise(Exception("Error: HDA* with %d workers found lengths %s" % (workers, lengths)))
+        print("HDA* x %-4d  %8.3fs  speedup %.2f" % (workers, hda_time, serial_time / hda_time))
@@ -0,0 +1,115 @@
+#!/usr/local/bin/python3
+# endgame_table.py : Exact distances for boards close to the goal
+#
+# A backward breadth first search from the goal lists every board that is at most DEPTH moves away from it, with
+# its exact distance. The solver returns straight away for boards in the table, and uses the exact distance as h for
+# any node in the table, so the search ends as soon as such a node is popped.
+#
+# The table is saved to one file of fixed size records (packed board, distance) sorted by board, which the solver
+# memory-maps and binary searches. To (re)build the file run: python3 endgame_table.py [depth]
+#
+
+import bisect
+import mmap
+import os
+import sys
+from collections import deque
+
+MAGIC = b"END1"
+BOARD_BYTES = 13
+# MAGIC and the depth byte, then records of a packed board and its distance.
+HEADER_BYTES = len(MAGIC) + 1
+RECORD_BYTES = BOARD_BYTES + 1
+
+# predecessors(board) must return the boards one move away from reaching board.
+def build_endgame_table(goal, predecessors, depth):
+    distances = {goal: 0}
+    que = deque([goal])
+    while que:
+        board = que.popleft()
+        distance = distances[board] + 1
+        if distance > depth:
+            continue
+        for prev in predecessors(board):
+            if prev not in distances:
+                distances[prev] = distance
+                que.append(prev)
+    return distances
+
+# Written under a name unique to this process first, so a reader never loads a half written file.
+def save_endgame_table(path, distances, depth):
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "wb") as file:
+        file.write(MAGIC + bytes([depth]))
+        for board in sorted(distances):
+            file.write(board.to_bytes(BOARD_BYTES, "little") + bytes([distances[board]]))
+    os.replace(tmp_path, path)
+
+# Every FENCE_STRIDE-th board is kept in memory, so a lookup is one bisect over those plus a binary search of at most
+# FENCE_STRIDE records of the mapped file.
+FENCE_STRIDE = 16
+
+class EndgameTable:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise(Exception("Error: " + path + " is not an endgame table"))
+
+        self.depth = self.data[len(MAGIC)]
+        # A truncated file ends in the middle of a record.
+        self.complete = (len(self.data) - HEADER_BYTES) % RECORD_BYTES == 0
+        self.count = (len(self.data) - HEADER_BYTES) // RECORD_BYTES
+        self.fences = [self.get_board(i) for i in range(0, self.count, FENCE_STRIDE)]
+
+    def __len__(self):
+        return self.count
+
+    # Packed board of the i-th record.
+    def get_board(self, i):
+        offset = HEADER_BYTES + i * RECORD_BYTES
+        return int.from_bytes(self.data[offset:offset + BOARD_BYTES], "little")
+
+    # Exact number of moves from board to the goal, or None if it is more than depth moves away. h is an admissible
+    # estimate of that number when the caller has one: a board with h > depth can't be in the table, so most boards
+    # of a search are answered without touching the file.
+    def get(self, board, h=0):
+        if h > self.depth:
+            return None
+        block = bisect.bisect_right(self.fences, board) - 1
+        if block < 0:
+            return None
+        (low, high) = (block * FENCE_STRIDE, min((block + 1) * FENCE_STRIDE, self.count))
+        while low < high:
+            middle = (low + high) // 2
+            found = self.get_board(middle)
+            if found == board:
+                return self.data[HEADER_BYTES + middle * RECORD_BYTES + BOARD_BYTES]
+            if found < board:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    # (board, distance) of every record, in board order.
+    def items(self):
+        for i in range(self.count):
+            yield (self.get_board(i), self.data[HEADER_BYTES + i * RECORD_BYTES + BOARD_BYTES])
+
+# Loads the table at path, building it first if it is missing, truncated or does not reach the requested depth.
+def load_endgame_table(path, goal, predecessors, depth):
+    if os.path.exists(path) and os.path.getsize(path) > len(MAGIC):
+        table = EndgameTable(path)
+        if table.complete and table.depth >= depth:
+            return table
+        table.data.close()
+    save_endgame_table(path, build_endgame_table(goal, predecessors, depth), depth)
+    return EndgameTable(path)
+
+if __name__ == "__main__":
+    import solver2021
+
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else solver2021.ENDGAME_DEPTH
+    table = build_endgame_table(solver2021.GOAL_STATE, solver2021.get_predecessors, depth)
+    save_endgame_table(solver2021.ENDGAME_PATH, table, depth)
+    print("Endgame table with %d boards written to %s" % (len(table), solver2021.ENDGAME_PATH))
@@ -0,0 +1,206 @@
+#!/usr/local/bin/python3
+# parallel_solver.py : Hash distributed A* (HDA*) for the 2021 sliding tile puzzle
+#
+# Every board is owned by one worker process, picked by a hash of the packed board. Each worker keeps its own fringe
+# and closed set, expands its best node, and sends the successors it doesn't own to their owners through queues.
+# Nodes carry their path as a bytes string of move codes, since their ancestors may live in other processes.
+#
+# The best solution found so far (the incumbent) is shared, and nodes with f >= incumbent are pruned. The search is
+# over when every worker is idle and no batch of nodes is in flight; the incumbent is then optimal.
+#
+
+import multiprocessing
+import os
+from queue import Empty
+
+import solver2021
+
+HASH_PRIME = 2305843009213693951
+INFINITY = 1 << 30
+# Seconds to wait for the path of the final incumbent, and for a worker to exit once told to stop.
+RESULT_TIMEOUT = 30
+JOIN_TIMEOUT = 5
+
+def get_owner(state, workers):
+    return state % HASH_PRIME % workers
+
+# Everything the workers share. lock guards the in flight counter and the idle flags together, so that the main
+# process always sees a consistent picture of them.
+class SharedState:
+    def __init__(self, context, workers):
+        self.inboxes = [context.Queue() for _ in range(workers)]
+        self.results = context.Queue()
+        self.incumbent = context.Value("i", INFINITY)
+        self.lock = context.Lock()
+        self.in_flight = context.Value("i", 0, lock=False)
+        self.idle = context.Array("b", [0] * workers, lock=False)
+        self.expanded = context.Array("q", [0] * workers, lock=False)
+        self.stop = context.Event()
+
+    # Registers a batch before it is queued, so the main process never sees it as delivered too early.
+    def send(self, worker, batch):
+        with self.lock:
+            self.in_flight.value += 1
+        self.inboxes[worker].put(batch)
+
+    # Publishes a solution if it beats the incumbent.
+    def offer(self, cost, path):
+        with self.incumbent.get_lock():
+            if cost < self.incumbent.value:
+                self.incumbent.value = cost
+                self.results.put((cost, path))
+
+class Worker:
+    def __init__(self, index, workers, shared):
+        self.index = index
+        self.workers = workers
+        self.shared = shared
+        self.endgame = solver2021.get_endgame_table()
+        self.que = solver2021.BucketFrontier()
+        self.closed = {}
+        self.expanded = 0
+
+    # node = (board, g, h, mismatches, path)
+    def add(self, node):
+        (state, g, h, mismatches, path) = node
+        if self.closed.get(state, INFINITY) <= g:
+            return
+        self.closed[state] = g
+        if g + h < self.shared.incumbent.value:
+            self.que.push((g, state, path, g + h), g + h, mismatches)
+
+    # Moves every batch waiting in the inbox to the fringe. Marking the worker busy and counting the batch as
+    # delivered happen under the lock in one step.
+    def receive(self):
+        while True:
+            try:
+                batch = self.shared.inboxes[self.index].get_nowait()
+            except Empty:
+                return
+            with self.shared.lock:
+                self.shared.idle[self.index] = 0
+                self.shared.in_flight.value -= 1
+            for node in batch:
+                self.add(node)
+
+    def expand(self, elem):
+        (g, state, path, f) = elem
+        if self.closed.get(state, INFINITY) < g:
+            return
+        if solver2021.is_goal(state):
+            self.shared.offer(g, path)
+            return
+        if self.endgame is not None and self.endgame.get(state, f - g) is not None:
+            completion = [solver2021.MOVE_NAMES.index(move) for move in solver2021.complete_from_endgame(state)]
+            self.shared.offer(g + len(completion), path + bytes(completion))
+            return
+
+        self.expanded += 1
+        heuristic_state = solver2021.get_heuristic_state(solver2021.unpack_board(state))
+        batches = {}
+        for i in range(len(solver2021.MOVES)):
+            succ = solver2021.apply_move(state, solver2021.MOVES[i])
+            (h, mismatches) = solver2021.get_successor_heuristic(heuristic_state, solver2021.MOVES[i])
+            if self.endgame is not None:
+                h = self.endgame.get(succ, h) or h
+            if g + 1 + h >= self.shared.incumbent.value:
+                continue
+            node = (succ, g + 1, h, mismatches, path + bytes([i]))
+            owner = get_owner(succ, self.workers)
+            if owner == self.index:
+                self.add(node)
+            else:
+                batches.setdefault(owner, []).append(node)
+        for owner in batches:
+            self.shared.send(owner, batches[owner])
+
+    def run(self):
+        while not self.shared.stop.is_set():
+            self.receive()
+            if self.que:
+                elem = self.que.pop()
+                if elem[3] < self.shared.incumbent.value:
+                    self.expand(elem)
+                continue
+            with self.shared.lock:
+                self.shared.idle[self.index] = 1
+            self.shared.expanded[self.index] = self.expanded
+            try:
+                batch = self.shared.inboxes[self.index].get(timeout=0.01)
+            except Empty:
+                continue
+            with self.shared.lock:
+                self.shared.idle[self.index] = 0
+                self.shared.in_flight.value -= 1
+            for node in batch:
+                self.add(node)
+        self.shared.expanded[self.index] = self.expanded
+
+def run_worker(index, workers, shared):
+    Worker(index, workers, shared).run()
+
+# Stops the workers. A worker that doesn't exit in time may be blocked flushing a batch to a dead worker's inbox.
+def stop_workers(shared, processes):
+    shared.stop.set()
+    for process in processes:
+        process.join(JOIN_TIMEOUT)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+# Solves a packed board with HDA*. Returns the moves and the number of states expanded by all workers.
+# Daemonic processes (such as the batch_solver.py pool workers) can't start children, so they use serial A* instead.
+def solve_hda(initial_board, workers=None):
+    if solver2021.is_goal(initial_board):
+        return ([], 1)
+    if multiprocessing.current_process().daemon:
+        return solver2021.solve_astar(initial_board)
+    workers = workers or solver2021.PARALLEL_WORKERS or os.cpu_count() or 1
+
+    # The tables are loaded before forking so every worker shares them.
+    solver2021.get_pattern_db()
+    solver2021.get_endgame_table()
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    shared = SharedState(context, workers)
+
+    heuristic_state = solver2021.get_heuristic_state(solver2021.unpack_board(initial_board))
+    start = (initial_board, 0, solver2021.get_state_h(heuristic_state), heuristic_state[4], b"")
+    shared.send(get_owner(initial_board, workers), [start])
+
+    processes = [context.Process(target=run_worker, args=(i, workers, shared)) for i in range(workers)]
+    for process in processes:
+        process.start()
+
+    best = None
+    while True:
+        try:
+            result = shared.results.get(timeout=0.01)
+            if best is None or result[0] < best[0]:
+                best = result
+        except Empty:
+            pass
+        with shared.lock:
+            done = shared.in_flight.value == 0 and all(shared.idle)
+        if done:
+            break
+        # Workers only exit once stopped, so an exit code here means one of them died and its nodes are lost.
+        if any([process.exitcode is not None for process in processes]):
+            stop_workers(shared, processes)
+            raise(Exception("Error: an HDA* worker exited early"))
+
+    if shared.incumbent.value == INFINITY:
+        stop_workers(shared, processes)
+        raise(Exception("Error: the board can't be solved"))
+    # The incumbent is published together with its path, so wait for the path of the final incumbent.
+    while best is None or best[0] > shared.incumbent.value:
+        try:
+            result = shared.results.get(timeout=RESULT_TIMEOUT)
+        except Empty:
+            stop_workers(shared, processes)
+            raise(Exception("Error: the path of the best solution never arrived"))
+        if best is None or result[0] < best[0]:
+            best = result
+    stop_workers(shared, processes)
+
+    return ([solver2021.MOVE_NAMES[i] for i in best[1]], sum(shared.expanded))
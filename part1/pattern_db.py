@@ -0,0 +1,109 @@
+#!/usr/local/bin/python3
+# pattern_db.py : Pattern databases for the 2021 sliding tile puzzle
+#
+# A pattern database stores, for every placement of a small group of tiles, the minimum number of moves needed to
+# bring those tiles to their goal cells (the other tiles are ignored). It is an admissible heuristic, and the max of
+# several databases is admissible as well.
+#
+# The tables are built once by a backward breadth first search from the goal and saved to one file, which the
+# solver memory-maps at startup. To (re)build the file run: python3 pattern_db.py
+#
+
+import mmap
+import os
+import sys
+from collections import deque
+
+CELLS = 20
+
+# Tile groups used by the solver: the columns of the goal board.
+PATTERNS = [(1, 6, 11, 16), (2, 7, 12, 17), (3, 8, 13, 18), (4, 9, 14, 19), (5, 10, 15, 20)]
+
+MAGIC = b"PDB1"
+UNREACHED = 255
+
+# Each placement of a pattern is ranked as sum(position of k-th tile * CELLS^k).
+def get_pattern_index(positions):
+    index = 0
+    for position in reversed(positions):
+        index = index * CELLS + position
+    return index
+
+# Backward breadth first search over the placements of the pattern tiles. perms are the move permutations
+# (new[i] = old[perm[i]]), so undoing a move brings the tile at cell i back to cell perm[i].
+def build_pattern_table(tiles, perms):
+    table = bytearray([UNREACHED]) * (CELLS ** len(tiles))
+    goal = tuple(tile - 1 for tile in tiles)
+    table[get_pattern_index(goal)] = 0
+    que = deque([goal])
+    while que:
+        positions = que.popleft()
+        distance = table[get_pattern_index(positions)] + 1
+        for perm in perms:
+            prev = tuple(perm[position] for position in positions)
+            index = get_pattern_index(prev)
+            if table[index] == UNREACHED:
+                table[index] = distance
+                que.append(prev)
+    return table
+
+# File layout: MAGIC, number of patterns, then for every pattern its size and tiles, then the tables in order.
+# Written under a name unique to this process first, so a reader never maps a half written file.
+def build_pattern_db(path, perms, patterns=PATTERNS):
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "wb") as file:
+        file.write(MAGIC + bytes([len(patterns)]))
+        for tiles in patterns:
+            file.write(bytes([len(tiles)]) + bytes(tiles))
+        for tiles in patterns:
+            file.write(build_pattern_table(tiles, perms))
+    os.replace(tmp_path, path)
+
+class PatternDatabase:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise(Exception("Error: " + path + " is not a pattern database"))
+
+        self.patterns = []
+        offset = len(MAGIC) + 1
+        for _ in range(self.data[len(MAGIC)]):
+            if offset >= len(self.data):
+                break
+            size = self.data[offset]
+            self.patterns.append(tuple(self.data[offset + 1:offset + 1 + size]))
+            offset += size + 1
+
+        self.pattern_of = {}
+        for i in range(len(self.patterns)):
+            for tile in self.patterns[i]:
+                self.pattern_of[tile] = i
+
+        self.offsets = []
+        for tiles in self.patterns:
+            self.offsets.append(offset)
+            offset += CELLS ** len(tiles)
+        # A truncated file would otherwise only fail on the first lookup past its end.
+        self.complete = len(self.data) == offset
+
+    # Moves needed by the i-th pattern, given the positions of its tiles.
+    def lookup(self, i, positions):
+        return self.data[self.offsets[i] + get_pattern_index(positions)]
+
+# Memory-maps the database at path, building it first if it is missing, truncated or was built for other patterns.
+def load_pattern_db(path, perms, patterns=PATTERNS):
+    if os.path.exists(path) and os.path.getsize(path) > len(MAGIC):
+        database = PatternDatabase(path)
+        if database.complete and database.patterns == [tuple(tiles) for tiles in patterns]:
+            return database
+        database.data.close()
+    build_pattern_db(path, perms, patterns)
+    return PatternDatabase(path)
+
+if __name__ == "__main__":
+    import solver2021
+
+    path = sys.argv[1] if len(sys.argv) > 1 else solver2021.PATTERN_DB_PATH
+    build_pattern_db(path, [move[1] for move in solver2021.MOVES])
+    print("Pattern database written to " + path)
@@ -6,74 +6,221 @@
 # Based on skeleton code by D. Crandall, January 2021
 #
 
+import heapq
+import math
+import os
 import sys
-from queue import PriorityQueue
+import time
+from array import array
+from operator import itemgetter
+
+import endgame_table
+import pattern_db
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 ROWS=4
 COLS=5
 
+# Search engine used by solve(): "astar", "ida", "hda" (parallel A*, see parallel_solver.py) or "anytime" (weighted
+# A* that improves its solution until ANYTIME_BUDGET_MS runs out).
+# It can also be picked with the SOLVER_ENGINE environment variable.
+SEARCH_ENGINE = os.environ.get("SOLVER_ENGINE", "astar")
+# Worker processes used by the "hda" engine, one per CPU when 0.
+PARALLEL_WORKERS = int(os.environ.get("SOLVER_WORKERS", "0"))
+# Time budget of the "anytime" engine, and the weights of h it goes through, ending with plain A*.
+ANYTIME_BUDGET_MS = int(os.environ.get("SOLVER_BUDGET_MS", "1000"))
+ANYTIME_WEIGHTS = [3, 2, 1.5, 1.25, 1]
+
+# When enabled the heuristic is the max of the tile distances and the pattern databases in PATTERN_DB_PATH.
+# The file is built on first use and memory-mapped afterwards. SOLVER_PATTERN_DB=0 turns it off.
+USE_PATTERN_DB = os.environ.get("SOLVER_PATTERN_DB", "1") != "0"
+PATTERN_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pattern_db.bin")
+PATTERN_DB = None
+
+# Scores the 9 successors of a node as one NumPy batch instead of one at a time. Used when NumPy is installed,
+# unless SOLVER_NUMPY=0 (see bench_heuristic.py for the cost of both paths).
+USE_NUMPY = np is not None and os.environ.get("SOLVER_NUMPY", "1") != "0"
+NUMPY_TABLES = None
+
+# Boards at most ENDGAME_DEPTH moves from the goal are looked up in an endgame table of exact distances, built on
+# first use and saved to ENDGAME_PATH. SOLVER_ENDGAME=0 turns it off.
+USE_ENDGAME_TABLE = os.environ.get("SOLVER_ENDGAME", "1") != "0"
+ENDGAME_DEPTH = 6
+ENDGAME_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "endgame.bin")
+ENDGAME_TABLE = None
+
+# Order of the permutation group generated by the 9 moves. build_stabilizer_chain shows it is all 20! permutations
+# (python3 -c "import solver2021; print(solver2021.get_move_group()[0])"), so it is stored here instead of being
+# worked out by every process. Set it to None after changing ROWS, COLS or the moves, and it is computed on first use.
+MOVE_GROUP_ORDER = math.factorial(ROWS * COLS)
+# Permutation group generated by the 9 moves, computed on first use (see get_move_group).
+MOVE_GROUP = None
+
 def printable_board(board):
     return "\n".join([ ('%3d ')*COLS  % board[j:(j+COLS)] for j in range(0, ROWS*COLS, COLS) ])
 
-compare_count = {0:0,1:0,2:0,3:0,4:0,5:0,6:0}
-
-class FringeItem:
-    def __init__(self, data, priority):
-        self.data = data
-        self.priority = priority
-    def __lt__(self, other):
-        if type(self.priority) is not tuple:
-            return self.priority < other.priority
-        for i in range(len(self.priority)):
-            if self.priority[i] != other.priority[i]:
-                compare_count[i] += 1
-                return self.priority[i] < other.priority[i]
-
-        compare_count[len(self.priority)] += 1
-        return True
-
-def shift(state, cells):
-    temp = state[cells[0]]
-    for i in range(len(cells) - 1):
-        state[cells[i]] = state[cells[i+1]]
-    state[cells[len(cells) -1]] = temp
+# A* frontier with one bucket per f value. f = g + h is a small int, so pushes append to a list and pops scan
+# forward from the lowest non empty bucket. Inside a bucket the items are split again by the tie breaker (the number
+# of mismatched neighbours), lower first, and the last pushed item among equals comes out first.
+class BucketFrontier:
+    def __init__(self):
+        self.buckets = []
+        self.counts = []
+        self.min_ties = []
+        self.min_f = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, item, f, tie):
+        while f >= len(self.buckets):
+            self.buckets.append([])
+            self.counts.append(0)
+            self.min_ties.append(sys.maxsize)
+        stacks = self.buckets[f]
+        while tie >= len(stacks):
+            stacks.append([])
+        stacks[tie].append(item)
+        self.counts[f] += 1
+        if tie < self.min_ties[f]:
+            self.min_ties[f] = tie
+        if f < self.min_f:
+            self.min_f = f
+        self.size += 1
+
+    def pop(self):
+        f = self.min_f
+        while not self.counts[f]:
+            f += 1
+        self.min_f = f
+        stacks = self.buckets[f]
+        tie = self.min_ties[f]
+        while not stacks[tie]:
+            tie += 1
+        self.counts[f] -= 1
+        self.min_ties[f] = tie if self.counts[f] else sys.maxsize
+        self.size -= 1
+        return stacks[tie].pop()
+
+# Memory cap of the transposition table, and the share of entries dropped when it is full. Only the table is capped:
+# the A* fringe and the node arena still grow with every node pushed, and an evicted board that is reached again is
+# pushed again, so the cap trades table memory for repeated work rather than bounding the whole search.
+TRANSPOSITION_TABLE_MB = 512
+TRANSPOSITION_EVICT_FRACTION = 0.25
+# Rough cost of one entry: the packed board int, the g value and the dict slot.
+TRANSPOSITION_ENTRY_BYTES = 120
+
+# Maps every board seen during the search to the best g value it was reached with. When the table is full the
+# oldest entries are evicted first; losing an entry only means that board may be pushed and expanded again.
+class TranspositionTable:
+    def __init__(self, max_mb=TRANSPOSITION_TABLE_MB, evict_fraction=TRANSPOSITION_EVICT_FRACTION):
+        self.max_entries = max(1, int(max_mb * 1024 * 1024 / TRANSPOSITION_ENTRY_BYTES))
+        self.evict_count = max(1, int(self.max_entries * evict_fraction))
+        self.entries = {}
+        self.evictions = 0
+
+    # True if the board was already reached with a cost of g or less.
+    def is_dominated(self, state, g):
+        best = self.entries.get(state)
+        return best is not None and best <= g
+
+    def put(self, state, g):
+        if state in self.entries:
+            del self.entries[state]
+        elif len(self.entries) >= self.max_entries:
+            self.evict()
+        self.entries[state] = g
+
+    # dicts keep insertion order, so the first keys are the oldest ones.
+    def evict(self):
+        oldest = [state for (state, _) in zip(self.entries, range(self.evict_count))]
+        for state in oldest:
+            del self.entries[state]
+        self.evictions += len(oldest)
+
+# States are packed into a single int: the tile at board position i lives in bits [5*i, 5*i + 5).
+# Packed states hash and compare as plain ints, so successors never copy a list.
+TILE_BITS = 5
+TILE_MASK = (1 << TILE_BITS) - 1
+
+def pack_board(board):
+    if board and type(board[0]) is list:
+        board = [j for i in board for j in i]
+    if len(board) != ROWS * COLS:
+        raise(Exception("Error: expected " + str(ROWS * COLS) + " tiles, got " + str(len(board))))
+    state = 0
+    for i in range(ROWS * COLS):
+        state |= board[i] << (TILE_BITS * i)
     return state
 
-def shift_left(state, row_num):
-    return shift(state[:], list(range(row_num * COLS, (row_num+1)*COLS)))
+def unpack_board(state):
+    return tuple((state >> (TILE_BITS * i)) & TILE_MASK for i in range(ROWS * COLS))
 
-def shift_right(state, row_num):
-    return shift(state[:], list(range((row_num+1) * COLS - 1, row_num * COLS - 1, -1)))
+GOAL_STATE = pack_board(list(range(1, ROWS * COLS + 1)))
 
-def shift_up(state, col_num):
-    return shift(state[:], list(range(col_num, ROWS*COLS + col_num, COLS)))
-
-def shift_down(state, col_num):
-    return shift(state[:], list(range((ROWS-1)*COLS + col_num, col_num-1, -COLS)))
+# Returns the cells touched by a move in ascending order, and whether tiles travel towards the lower index.
+def get_move_cells(move):
+    dir = move[0]
+    num = int(move[1:]) - 1
+    if dir in "LR":
+        return list(range(num * COLS, (num + 1) * COLS)), dir == "L"
+    return list(range(num, ROWS * COLS, COLS)), dir == "U"
+
+# Builds everything needed to apply a move: the permutation (new[i] = old[perm[i]]), a getter applying it to an
+# unpacked board, and the masks used to rotate the moved tiles inside the packed int. Tiles of a row/column are evenly spaced, so one move is a rotation of
+# the selected bits by one tile.
+def build_move(move):
+    cells, towards_lower = get_move_cells(move)
+    perm = list(range(ROWS * COLS))
+    for i in range(len(cells)):
+        if towards_lower:
+            perm[cells[i]] = cells[(i + 1) % len(cells)]
+        else:
+            perm[cells[i]] = cells[i - 1]
+
+    mask = 0
+    for cell in cells:
+        mask |= TILE_MASK << (TILE_BITS * cell)
+    lead = TILE_MASK << (TILE_BITS * cells[0])
+    step = TILE_BITS * (cells[1] - cells[0])
+    span = step * (len(cells) - 1)
+    all_cells = (1 << (TILE_BITS * ROWS * COLS)) - 1
+    return (move, tuple(perm), tuple(cells), towards_lower, mask, all_cells ^ mask, lead, step, span, itemgetter(*perm))
+
+# The 9 legal moves, in the order successors are generated.
+MOVE_NAMES = ["L1", "R2", "L3", "R4", "U1", "D2", "U3", "D4", "U5"]
+MOVES = [build_move(move) for move in MOVE_NAMES]
+
+def apply_move(state, move):
+    (towards_lower, mask, keep, lead, step, span) = move[3:9]
+    moved = state & mask
+    if towards_lower:
+        return (state & keep) | ((moved >> step) & mask) | ((moved & lead) << span)
+    return (state & keep) | ((moved << step) & mask) | ((moved >> span) & lead)
+
+# INVERSE_MOVES[i] undoes MOVES[i]: the same row or column moved the other way.
+INVERSE_DIRECTION = {"L": "R", "R": "L", "U": "D", "D": "U"}
+INVERSE_MOVES = [build_move(INVERSE_DIRECTION[move[0]] + move[1:]) for move in MOVE_NAMES]
+
+# Boards one move away from reaching the state.
+def get_predecessors(state):
+    return [apply_move(state, move) for move in INVERSE_MOVES]
 
 # return a list of possible successor states
 def successors(state):
-    states = []
-    for i in range(ROWS):
-        if i%2 == 0:
-            states.append((shift_left(state, i), "L"+str(i+1)))
-        else:
-            states.append((shift_right(state, i), "R" + str(i+1)))
-
-    for i in range(COLS):
-        if i%2 == 0:
-            states.append((shift_up(state, i), "U" + str(i+1)))
-        else:
-            states.append((shift_down(state, i), "D" + str(i+1)))
-
-    return states
+    return [(apply_move(state, move), move[0]) for move in MOVES]
 
 def cell_num(i, j):
     return i*COLS + j
 
 # check if we've reached the goal
 def is_goal(state):
-    return all([state[i] == i+1 for i in range(ROWS * COLS)])
+    return state == GOAL_STATE
 
 def get_cell_from_index(index):
     return (int(index/COLS), index%COLS)
@@ -135,6 +282,13 @@ def get_manhatten_distance(cell1, cell2):
 
     return min(min_distance, row_distance + col_distance)
 
+# Minimum moves for the tile at a cell to reach any other cell, indexed as DISTANCES[cell][goal_cell]. Each column is
+# a one tile pattern database (a backward breadth first search from the goal cell), so the values are exact and h
+# stays admissible; get_manhatten_distance() overestimates some of them.
+DISTANCES = list(zip(*[pattern_db.build_pattern_table((goal_cell + 1,), [move[1] for move in MOVES])
+                       for goal_cell in range(ROWS * COLS)]))
+MAX_DISTANCE = max([max(row) for row in DISTANCES])
+
 # This function calculates the number of mismatched neighbours of a cell. Total neighbours of a cell are 4.
 def get_mismatches_for_cell(state, index):
     elem = state[index]
@@ -159,6 +313,29 @@ def get_mismatches_for_cell(state, index):
 
     return (row_mismatches, col_mismatches)
 
+# Neighbours of each cell, wrapping around within the row (left/right) and the column (up/down).
+LEFT = [cell_num(i // COLS, (i - 1) % COLS) for i in range(ROWS * COLS)]
+RIGHT = [cell_num(i // COLS, (i + 1) % COLS) for i in range(ROWS * COLS)]
+UP = [(i - COLS) % (ROWS * COLS) for i in range(ROWS * COLS)]
+DOWN = [(i + COLS) % (ROWS * COLS) for i in range(ROWS * COLS)]
+
+# Table driven version of sum(get_mismatches_for_cell(state, index)).
+def get_cell_mismatches(state, index):
+    elem = state[index]
+    mismatches = (elem - COLS != state[UP[index]]) + (elem + COLS != state[DOWN[index]])
+    if elem % ROWS not in [0,1]:
+        mismatches += (elem - 1 != state[LEFT[index]]) + (elem + 1 != state[RIGHT[index]])
+    elif elem % ROWS == 0:
+        mismatches += (elem - 1 != state[LEFT[index]]) + (index + 2 != state[RIGHT[index]])
+    return mismatches
+
+# Cells whose mismatch count can change when a move is made: the moved cells and their neighbours.
+MISMATCH_CELLS = {move[0]: sorted(set([j for i in move[2] for j in (i, LEFT[i], RIGHT[i], UP[i], DOWN[i])]))
+                  for move in MOVES}
+
+# Where each cell's tile ends up after a move, the inverse of the move permutation.
+MOVE_DESTS = {move[0]: [move[1].index(i) for i in range(ROWS * COLS)] for move in MOVES}
+
 # Sums all the mismatched neighbours of a cell.
 def get_total_mismatches(state):
     return sum([sum(get_mismatches_for_cell(state, i)) for i in range(ROWS * COLS)])
@@ -174,25 +351,112 @@ def get_mismatch_coefficient(state):
     return col_mismatches / (ROWS*2) + row_mismatches / (COLS*2)
 
 def get_h(state):
-    global higher_counts
-    manhatn =  max([get_manhatten_distance(i, state[i] - 1) for i in range(len(state))])
-    # mismatches = get_mismatch_coefficient(state)
-
-    return manhatn
+    return max([DISTANCES[i][state[i] - 1] for i in range(ROWS * COLS)])
 
 # This function returns the count of tiles that are at max distance from their goal positions.
 # If there 4 nodes that are at 5 distance away and 2 nodes that are 7 distance away, then it returns 2.
 def get_max_distance_node_count(state):
-    max_count = 0
-    max_distance = 0
+    counts = get_heuristic_state(state)[2]
+    return counts[max_distance(counts)]
+
+def get_pattern_db():
+    global PATTERN_DB
+    if PATTERN_DB is None and USE_PATTERN_DB:
+        PATTERN_DB = pattern_db.load_pattern_db(PATTERN_DB_PATH, [move[1] for move in MOVES])
+    return PATTERN_DB
+
+# Per node heuristic state: (tiles, per-tile distances, count of tiles at each distance, per-cell mismatches,
+# mismatch sum, cell of each tile, pattern database values). It is built once when a node is expanded, and its
+# 9 successors are scored from it incrementally.
+def get_heuristic_state(tiles):
+    distances = [DISTANCES[i][tiles[i] - 1] for i in range(ROWS * COLS)]
+    counts = [0] * (MAX_DISTANCE + 1)
+    for distance in distances:
+        counts[distance] += 1
+    mismatches = [get_cell_mismatches(tiles, i) for i in range(ROWS * COLS)]
+
+    positions = [0] * (ROWS * COLS + 1)
     for i in range(ROWS * COLS):
-        dist = get_manhatten_distance(i, state[i] - 1)
-        if dist > max_distance:
-            max_distance = dist
-            max_count = 1
-        elif dist == max_distance:
-            max_count += 1
-    return max_count
+        positions[tiles[i]] = i
+    database = get_pattern_db()
+    pattern_values = []
+    if database is not None:
+        pattern_values = [database.lookup(i, [positions[tile] for tile in database.patterns[i]])
+                          for i in range(len(database.patterns))]
+    return (tiles, distances, counts, mismatches, sum(mismatches), positions, pattern_values)
+
+def max_distance(counts):
+    distance = MAX_DISTANCE
+    while not counts[distance]:
+        distance -= 1
+    return distance
+
+# h of the node the heuristic state was built for.
+def get_state_h(heuristic_state):
+    return max([max_distance(heuristic_state[2])] + heuristic_state[6])
+
+# Returns (h, total mismatches) of the board reached by making the move, by only revisiting the moved tiles, the
+# cells whose neighbours were moved and the patterns that have a moved tile.
+def get_successor_heuristic(heuristic_state, move):
+    (tiles, distances, counts, mismatches, mismatch_sum, positions, pattern_values) = heuristic_state
+    succ_tiles = move[9](tiles)
+    counts = counts[:]
+    for cell in move[2]:
+        counts[distances[cell]] -= 1
+        counts[DISTANCES[cell][succ_tiles[cell] - 1]] += 1
+    for cell in MISMATCH_CELLS[move[0]]:
+        mismatch_sum += get_cell_mismatches(succ_tiles, cell) - mismatches[cell]
+    h = max_distance(counts)
+
+    if pattern_values:
+        database = PATTERN_DB
+        dest = MOVE_DESTS[move[0]]
+        pattern_values = pattern_values[:]
+        for i in set([database.pattern_of.get(tiles[cell]) for cell in move[2]]):
+            if i is not None:
+                pattern_values[i] = database.lookup(i, [dest[positions[tile]] for tile in database.patterns[i]])
+        h = max(h, max(pattern_values))
+    return (h, mismatch_sum)
+
+def get_numpy_tables():
+    global NUMPY_TABLES
+    if NUMPY_TABLES is None:
+        cells = np.arange(ROWS * COLS)
+        tables = {"perms": np.array([move[1] for move in MOVES]),
+                  "cells": cells,
+                  "distances": np.array(DISTANCES),
+                  "left": np.array(LEFT), "right": np.array(RIGHT), "up": np.array(UP), "down": np.array(DOWN)}
+        database = get_pattern_db()
+        if database is not None:
+            tables["patterns"] = np.array(database.patterns) - 1
+            tables["powers"] = pattern_db.CELLS ** np.arange(tables["patterns"].shape[1])
+            tables["offsets"] = np.array(database.offsets)
+            tables["pattern_db"] = np.frombuffer(database.data, dtype=np.uint8)
+        NUMPY_TABLES = tables
+    return NUMPY_TABLES
+
+# NumPy version of [get_successor_heuristic(get_heuristic_state(tiles), move) for move in MOVES]. The successors
+# are built as one (9, 20) array with the move permutations, and every term is computed for all of them at once.
+def get_successor_scores_numpy(tiles):
+    tables = get_numpy_tables()
+    boards = np.array(tiles)[tables["perms"]]
+    h = tables["distances"][tables["cells"], boards - 1].max(axis=1)
+
+    if "pattern_db" in tables:
+        positions = np.argsort(boards, axis=1)
+        indexes = (positions[:, tables["patterns"]] * tables["powers"]).sum(axis=2)
+        h = np.maximum(h, tables["pattern_db"][tables["offsets"] + indexes].max(axis=1))
+
+    # Same rules as get_cell_mismatches: tiles with value % ROWS == 1 have no row checks, and for value % ROWS == 0
+    # the right hand neighbour is compared to cell + 2.
+    remainders = boards % ROWS
+    has_row = remainders != 1
+    right_goal = np.where(remainders == 0, tables["cells"] + 2, boards + 1)
+    mismatches = ((boards - COLS != boards[:, tables["up"]]).sum(axis=1)
+                  + (boards + COLS != boards[:, tables["down"]]).sum(axis=1)
+                  + (has_row & (boards - 1 != boards[:, tables["left"]])).sum(axis=1)
+                  + (has_row & (right_goal != boards[:, tables["right"]])).sum(axis=1))
+    return list(zip(h.tolist(), mismatches.tolist()))
 
 def solve(initial_board):
     """
@@ -205,51 +469,373 @@ def solve(initial_board):
     5. The current code just returns a dummy solution.
     """
 
-    if type(initial_board[0]) is list:
-        initial_board = [j for i in initial_board for j in i]
-
-    que = PriorityQueue()
-    que.put(FringeItem((0, initial_board, ""), (0, 0)))
+    (route, state_count) = search(initial_board)
+    print("Total states visited: " + str(state_count))
+    return route
+
+def compose_perms(a, b):
+    return tuple([a[i] for i in b])
+
+def invert_perm(a):
+    inverse = [0] * len(a)
+    for i in range(len(a)):
+        inverse[a[i]] = i
+    return tuple(inverse)
+
+# Schreier-Sims: builds a base and strong generating set of the group generated by the move permutations. Each level
+# is [base point, generators added at this level, transversal], where the transversal maps every point of the base
+# point's orbit to a group element taking the base point there.
+def build_stabilizer_chain(generators):
+    identity = tuple(range(ROWS * COLS))
+    levels = []
+
+    # Divides g by the transversals from level start down. Returns what is left and the level where it stopped.
+    def strip(g, start):
+        for i in range(start, len(levels)):
+            (base, _, transversal) = levels[i]
+            if g[base] not in transversal:
+                return (g, i)
+            g = compose_perms(invert_perm(transversal[g[base]]), g)
+        return (g, len(levels))
+
+    def add_generator(g, level):
+        if level == len(levels):
+            base = [i for i in range(len(g)) if g[i] != i][0]
+            levels.append([base, [], {base: identity}])
+        levels[level][1].append(g)
+
+    for g in generators:
+        (residue, level) = strip(g, 0)
+        if residue != identity:
+            add_generator(residue, level)
+
+    # A level is complete once every Schreier generator of it strips to the identity through the deeper levels.
+    # A new generator at some level sends the check back there, and it then climbs up again.
+    level = len(levels) - 1
+    while level >= 0:
+        base = levels[level][0]
+        generators = [g for i in range(level, len(levels)) for g in levels[i][1]]
+        transversal = {base: identity}
+        que = [base]
+        for point in que:
+            for g in generators:
+                if g[point] not in transversal:
+                    transversal[g[point]] = compose_perms(g, transversal[point])
+                    que.append(g[point])
+        levels[level][2] = transversal
+
+        next_level = level - 1
+        for point in transversal:
+            for g in generators:
+                schreier = compose_perms(invert_perm(transversal[g[point]]), compose_perms(g, transversal[point]))
+                (residue, stopped) = strip(schreier, level + 1)
+                if residue != identity:
+                    add_generator(residue, stopped)
+                    next_level = stopped
+                    break
+            if next_level != level - 1:
+                break
+        level = next_level
+
+    return (levels, strip)
+
+# Returns (group order, stabilizer chain, strip function) of the group generated by the 9 moves. A board is
+# reachable iff its permutation (cell -> goal cell of its tile) belongs to this group.
+def get_move_group():
+    global MOVE_GROUP
+    if MOVE_GROUP is None:
+        (levels, strip) = build_stabilizer_chain([move[1] for move in MOVES])
+        order = 1
+        for level in levels:
+            order *= len(level[2])
+        MOVE_GROUP = (order, levels, strip)
+    return MOVE_GROUP
+
+def get_parity(perm):
+    seen = [False] * len(perm)
+    parity = 0
+    for i in range(len(perm)):
+        length = 0
+        while not seen[i]:
+            seen[i] = True
+            i = perm[i]
+            length += 1
+        if length:
+            parity ^= (length - 1) & 1
+    return parity
+
+# Raises an error for boards that can't reach the goal with the 9 moves. Row moves are 5-cycles and column moves
+# odd 4-cycles, and the group they generate is the whole symmetric group (MOVE_GROUP_ORDER), so only the tiles
+# themselves need to be checked. The parity (alternating group) and full membership tests are kept for other board
+# sizes or move sets.
+def check_solvable(board):
+    if board and type(board[0]) is list:
+        board = [j for i in board for j in i]
+    if len(board) != ROWS * COLS or sorted(board) != list(range(1, ROWS * COLS + 1)):
+        raise(Exception("Error: the board must hold each tile from 1 to " + str(ROWS * COLS) + " exactly once"))
+
+    order = MOVE_GROUP_ORDER if MOVE_GROUP_ORDER is not None else get_move_group()[0]
+    perm = tuple([tile - 1 for tile in board])
+    if order == math.factorial(ROWS * COLS):
+        return
+    if order * 2 == math.factorial(ROWS * COLS):
+        if get_parity(perm):
+            raise(Exception("Error: the board is an odd permutation of the goal, which the moves can't reach"))
+        return
+    strip = get_move_group()[2]
+    if strip(perm, 0)[0] != tuple(range(ROWS * COLS)):
+        raise(Exception("Error: the board can't be reached from the goal with the allowed moves"))
+
+# Solves the board with the configured engine. Returns the moves and the number of states visited.
+def search(initial_board):
+    check_solvable(initial_board)
+    initial_board = pack_board(initial_board)
+    endgame = get_endgame_table()
+    if endgame is not None and endgame.get(initial_board) is not None:
+        return (complete_from_endgame(initial_board), 1)
+    if SEARCH_ENGINE == "ida":
+        return solve_ida(initial_board)
+    if SEARCH_ENGINE == "hda":
+        import parallel_solver
+        return parallel_solver.solve_hda(initial_board)
+    if SEARCH_ENGINE == "anytime":
+        for result in solve_anytime(initial_board):
+            pass
+        return (result["moves"], result["nodes"])
+    return solve_astar(initial_board)
+
+def get_endgame_table():
+    global ENDGAME_TABLE
+    if ENDGAME_TABLE is None and USE_ENDGAME_TABLE:
+        ENDGAME_TABLE = endgame_table.load_endgame_table(ENDGAME_PATH, GOAL_STATE, get_predecessors, ENDGAME_DEPTH)
+    return ENDGAME_TABLE
+
+# Moves from a board in the endgame table to the goal: at every step some move leads to a board one move closer.
+def complete_from_endgame(state):
+    endgame = get_endgame_table()
+    path = []
+    distance = endgame.get(state)
+    while distance > 0:
+        for move in MOVES:
+            succ = apply_move(state, move)
+            if endgame.get(succ) == distance - 1:
+                path.append(move[0])
+                state = succ
+                distance -= 1
+                break
+    return path
+
+# Paths are not stored in the fringe. Every generated node gets an index in a node arena holding its parent index
+# and the code of the move that reached it, and the move list is rebuilt once the goal is popped.
+#
+# Nodes found in the endgame table get their exact distance as h. When one of them is popped its f is the cost of a
+# solution and no other node in the fringe can do better, so the rest of the path comes from the table.
+def solve_astar(initial_board):
+    endgame = get_endgame_table()
+    parents = array("l", [-1])
+    moves = bytearray([0])
+
+    que = BucketFrontier()
+    que.push((0, initial_board, 0, 0), 0, 0)
+    seen = TranspositionTable()
+    seen.put(initial_board, 0)
 
     state_count = 1
 
     total_for_loop = 0
 
-    while not que.empty():
+    while que:
 
         if total_for_loop%1000 == 400:
             # print("for loop counts: " + str(total_for_loop))
-            # print("compare stats: " + str(compare_count))
             pass
 
         state_count = state_count + 1
 
-        fringe_item = que.get()
-        elem = fringe_item.data
+        elem = que.pop()
+        # A cheaper path to this board was pushed after this one.
+        if seen.is_dominated(elem[1], elem[0] - 1):
+            continue
         if is_goal(elem[1]):
-            if elem[2] == '':
-                return []
-            print("Total states visited: " + str(state_count))
-            return elem[2].strip().split(" ")
-        for succ in successors(elem[1]):
+            return (rebuild_path(parents, moves, elem[2]), state_count)
+        if endgame is not None and endgame.get(elem[1], elem[3]) is not None:
+            return (rebuild_path(parents, moves, elem[2]) + complete_from_endgame(elem[1]), state_count)
+        if USE_NUMPY:
+            scores = get_successor_scores_numpy(unpack_board(elem[1]))
+        else:
+            heuristic_state = get_heuristic_state(unpack_board(elem[1]))
+        for i in range(len(MOVES)):
             total_for_loop += 1
-            a=get_h(succ[0])
-
-            que.put(FringeItem((elem[0] + 1, succ[0], elem[2] + " " + succ[1]), (elem[0] + 1 + a, get_total_mismatches(succ[0]))))
+            succ = apply_move(elem[1], MOVES[i])
+            if seen.is_dominated(succ, elem[0] + 1):
+                continue
+            seen.put(succ, elem[0] + 1)
+            if USE_NUMPY:
+                (a, mismatches) = scores[i]
+            else:
+                (a, mismatches) = get_successor_heuristic(heuristic_state, MOVES[i])
+            if endgame is not None:
+                a = endgame.get(succ, a) or a
+
+            parents.append(elem[2])
+            moves.append(i)
+            que.push((elem[0] + 1, succ, len(moves) - 1, a), elem[0] + 1 + a, mismatches)
+
+def rebuild_path(parents, moves, node):
+    path = []
+    while parents[node] >= 0:
+        path.append(MOVE_NAMES[moves[node]])
+        node = parents[node]
+    path.reverse()
+    return path
+
+# In this move set the inverse of a move is the same move repeated (a row moved 4 times, a column 3 times), and
+# moves along the same axis commute. So a move is only allowed after another move along the same axis if it has a
+# higher index, or if it repeats the previous move without completing the full cycle.
+def can_follow(prev, run, move):
+    if prev < 0:
+        return True
+    if move == prev:
+        return run < len(MOVES[move][2]) - 1
+    return move > prev or (MOVE_NAMES[move][0] in "LR") != (MOVE_NAMES[prev][0] in "LR")
+
+# Iterative deepening A*: depth first searches bounded by f = g + h, where the bound is raised to the smallest f
+# that exceeded it after each round. Only the current path is kept, so memory grows with the solution depth.
+def solve_ida(initial_board):
+    bound = get_state_h(get_heuristic_state(unpack_board(initial_board)))
+    path = []
+    state_count = [0]
+    while True:
+        bound = ida_search(initial_board, 0, bound, path, -1, 0, state_count)
+        if bound is None:
+            return (path, state_count[0])
+
+# Returns None once the goal is found (path then holds the moves), otherwise the smallest f above the bound.
+# Boards in the endgame table have an exact h, so one within the bound completes the path straight away.
+def ida_search(state, g, bound, path, prev, run, state_count):
+    state_count[0] += 1
+    if is_goal(state):
+        return None
+    endgame = get_endgame_table()
+    heuristic_state = get_heuristic_state(unpack_board(state))
+    distance = endgame.get(state, get_state_h(heuristic_state)) if endgame is not None else None
+    if distance is not None:
+        if g + distance > bound:
+            return g + distance
+        path.extend(complete_from_endgame(state))
+        return None
+
+    children = []
+    for i in range(len(MOVES)):
+        if can_follow(prev, run, i):
+            (h, mismatches) = get_successor_heuristic(heuristic_state, MOVES[i])
+            if endgame is not None:
+                h = endgame.get(apply_move(state, MOVES[i]), h) or h
+            children.append((g + 1 + h, mismatches, i))
+    children.sort()
+
+    next_bound = float("inf")
+    for (f, _, i) in children:
+        if f > bound:
+            return min(next_bound, f)
+        path.append(MOVE_NAMES[i])
+        t = ida_search(apply_move(state, MOVES[i]), g + 1, bound, path, i, run + 1 if i == prev else 1, state_count)
+        if t is None:
+            return None
+        path.pop()
+        next_bound = min(next_bound, t)
+    return next_bound
+
+# Anytime repairing A*: a weighted A* (f = g + w * h) finds a first solution quickly, then w is lowered and the search
+# goes on from the nodes already generated, each round tightening the solution and its bound. Like the part3 solver,
+# it yields every improved solution, as {"moves", "length", "weight", "suboptimality", "nodes"}, where
+# suboptimality is a proven bound on length / optimal length. It stops once the solution is proven optimal or the
+# budget runs out; the first solution is always yielded, even if it takes longer than the budget.
+def solve_anytime(initial_board, budget_ms=None):
+    deadline = time.time() + (ANYTIME_BUDGET_MS if budget_ms is None else budget_ms) / 1000
+    endgame = get_endgame_table()
+    g_values = {initial_board: 0}
+    heuristic_state = get_heuristic_state(unpack_board(initial_board))
+    h_values = {initial_board: get_state_h(heuristic_state)}
+    mismatch_values = {initial_board: heuristic_state[4]}
+    parents = {initial_board: None}
+    state_count = 0
+    best = None
+    reported = None
+
+    # Boards left to expand by the next round, with their g.
+    pending = {initial_board: 0}
+    for weight in ANYTIME_WEIGHTS:
+        # Keys are (f, mismatches, -g): among equal f the board with fewer mismatched neighbours comes first, then
+        # the deepest one.
+        open_list = [(g + weight * h_values[state], mismatch_values[state], -g, state) for (state, g) in pending.items()]
+        heapq.heapify(open_list)
+        closed = set()
+        inconsistent = {}
+        out_of_time = False
+        # Nodes are expanded until none in the fringe could lead to a better solution under this weight.
+        while open_list and (best is None or open_list[0][0] < len(best)):
+            item = heapq.heappop(open_list)
+            (_, _, g, state) = item
+            g = -g
+            if g != g_values[state] or state in closed:
+                continue
+            # The board goes back to the fringe unexpanded, so its g + h still counts towards the lower bound.
+            if best is not None and (state_count + 1) % 256 == 0 and time.time() > deadline:
+                heapq.heappush(open_list, item)
+                out_of_time = True
+                break
+            closed.add(state)
+            state_count += 1
+            if is_goal(state):
+                best = rebuild_anytime_path(parents, state)
+                continue
+
+            heuristic_state = get_heuristic_state(unpack_board(state))
+            for i in range(len(MOVES)):
+                succ = apply_move(state, MOVES[i])
+                if g + 1 >= g_values.get(succ, sys.maxsize):
+                    continue
+                if succ not in h_values:
+                    (h_values[succ], mismatch_values[succ]) = get_successor_heuristic(heuristic_state, MOVES[i])
+                    if endgame is not None:
+                        h_values[succ] = endgame.get(succ, h_values[succ]) or h_values[succ]
+                g_values[succ] = g + 1
+                parents[succ] = (state, i)
+                # A closed board reached by a shorter path waits for the next round instead of being reopened.
+                if succ in closed:
+                    inconsistent[succ] = g + 1
+                else:
+                    heapq.heappush(open_list, (g + 1 + weight * h_values[succ], mismatch_values[succ], -g - 1, succ))
+
+        # Every board that could still lead to a shorter solution is in the fringe or the inconsistent list, so the
+        # smallest g + h among them is a lower bound of the optimal length.
+        pending = {state: g_values[state] for (_, _, g, state) in open_list
+                   if -g == g_values[state] and state not in closed}
+        pending.update(inconsistent)
+        lower_bound = min([g + h_values[state] for (state, g) in pending.items()] + [len(best)])
+        suboptimality = len(best) / lower_bound if lower_bound else 1
+        if not out_of_time:
+            suboptimality = min(weight, suboptimality)
+        if reported is None or (len(best), suboptimality) < reported:
+            reported = (len(best), suboptimality)
+            yield {"moves": best, "length": len(best), "weight": weight, "suboptimality": suboptimality,
+                   "nodes": state_count}
+        if out_of_time or suboptimality <= 1 or time.time() > deadline:
+            return
+
+def rebuild_anytime_path(parents, state):
+    path = []
+    while parents[state] is not None:
+        (state, move) = parents[state]
+        path.append(MOVE_NAMES[move])
+    path.reverse()
+    return path
 
 # This function was written for testing purpose. This function  modifies the board. So we make 4 moves on perfect board,
 # then the modified board is solved. This prevents generating board by hand. Instead we let the program generate the board.
 def make_move(state, move):
-    dir = move[0]
-    num = int(move[1:]) - 1
-    if dir == 'L':
-        return shift_left(state, num)
-    if dir == 'R':
-        return shift_right(state, num)
-    if dir == 'D':
-        return shift_down(state, num)
-    if dir == 'U':
-        return shift_up(state, num)
+    return list(unpack_board(apply_move(pack_board(state), build_move(move))))
 
 def make_moves(state, moves):
     moves = moves.split(" ")
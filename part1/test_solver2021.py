@@ -0,0 +1,281 @@
+# !/usr/bin/env python3
+# test_solver2021.py : Tests of the board representation, heuristics and search engines of solver2021.py, and of the
+# tools built on it
+#
+# Boards are made by moving the goal board with the inverse moves (R1, L2, ...), so none of them is more than
+# len(scramble) moves from the goal.
+
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+from array import array
+
+import pytest
+
+import batch_solver
+import endgame_table
+import parallel_solver
+import pattern_db
+import solver2021
+
+GOAL = list(range(1, solver2021.ROWS * solver2021.COLS + 1))
+
+# Fixed boards for the search engines, 6 to 13 moves from the goal.
+SCRAMBLES = ["R1 D1 R3 U2 L2 D5",
+             "R1 U4 D3 L4 R3 D1 L2 U2",
+             "D3 L2 R1 D1 R3 L4 U2 D5 R1 U4",
+             "L4 D1 R3 U2 D5 L2 R1 U4 D3 R1 L4",
+             "U2 R1 D5 L4 D1 R3 U4 L2 D3 R1 U2 L4 D5"]
+
+def get_board(scramble):
+    return solver2021.pack_board(solver2021.make_moves(GOAL, scramble))
+
+# Makes the moves on the packed board and checks that they reach the goal.
+def check_route(board, route):
+    for move in route:
+        board = solver2021.apply_move(board, solver2021.MOVES[solver2021.MOVE_NAMES.index(move)])
+    assert solver2021.is_goal(board), "the moves don't solve the board"
+
+def get_random_boards(count, depth, seed):
+    rng = random.Random(seed)
+    boards = []
+    for _ in range(count):
+        board = solver2021.GOAL_STATE
+        for _ in range(depth):
+            board = solver2021.apply_move(board, rng.choice(solver2021.INVERSE_MOVES))
+        boards.append(board)
+    return boards
+
+def test_pack_round_trip():
+    for board in get_random_boards(50, 20, 1):
+        tiles = solver2021.unpack_board(board)
+        assert sorted(tiles) == GOAL
+        assert solver2021.pack_board(list(tiles)) == board
+    rows = [GOAL[i:i + solver2021.COLS] for i in range(0, len(GOAL), solver2021.COLS)]
+    assert solver2021.pack_board(rows) == solver2021.GOAL_STATE
+
+# apply_move rotates bits of the packed int; it must match the move permutation on the unpacked board.
+def test_apply_move_matches_permutation():
+    for board in get_random_boards(50, 20, 2):
+        tiles = solver2021.unpack_board(board)
+        for move in solver2021.MOVES:
+            expected = tuple([tiles[i] for i in move[1]])
+            assert solver2021.unpack_board(solver2021.apply_move(board, move)) == expected
+            assert move[9](tiles) == expected
+
+def test_inverse_moves_undo_moves():
+    for board in get_random_boards(20, 20, 3):
+        for (move, inverse) in zip(solver2021.MOVES, solver2021.INVERSE_MOVES):
+            assert solver2021.apply_move(solver2021.apply_move(board, move), inverse) == board
+
+# The incremental scores of the 9 successors must equal a full pass over each successor board.
+def test_successor_heuristic_matches_full_pass():
+    for board in get_random_boards(50, 20, 4):
+        heuristic_state = solver2021.get_heuristic_state(solver2021.unpack_board(board))
+        for move in solver2021.MOVES:
+            succ_state = solver2021.get_heuristic_state(solver2021.unpack_board(solver2021.apply_move(board, move)))
+            expected = (solver2021.get_state_h(succ_state), succ_state[4])
+            assert solver2021.get_successor_heuristic(heuristic_state, move) == expected
+
+# The tile distances must be the exact distances of a one tile puzzle: 0 at the goal cell, and elsewhere one more
+# than the best cell a move can carry the tile to (get_manhatten_distance() fails this, e.g. for DISTANCES[14][0]).
+def test_tile_distances_are_exact():
+    for goal_cell in range(solver2021.ROWS * solver2021.COLS):
+        assert solver2021.DISTANCES[goal_cell][goal_cell] == 0
+        for cell in range(solver2021.ROWS * solver2021.COLS):
+            if cell == goal_cell:
+                continue
+            reachable = [move[1].index(cell) for move in solver2021.MOVES]
+            assert solver2021.DISTANCES[cell][goal_cell] == \
+                1 + min([solver2021.DISTANCES[dest][goal_cell] for dest in reachable])
+
+# h must never be more than the exact distance, checked on every board of the endgame table.
+def test_heuristic_is_admissible():
+    endgame = solver2021.get_endgame_table()
+    for (board, distance) in endgame.items():
+        heuristic_state = solver2021.get_heuristic_state(solver2021.unpack_board(board))
+        assert solver2021.get_state_h(heuristic_state) <= distance
+
+# check_solvable() trusts MOVE_GROUP_ORDER instead of building the stabilizer chain, so the two must agree.
+def test_move_group_order():
+    assert solver2021.get_move_group()[0] == solver2021.MOVE_GROUP_ORDER
+
+def test_check_solvable_rejects_bad_boards():
+    solver2021.check_solvable(GOAL)
+    solver2021.check_solvable([GOAL[i:i + solver2021.COLS] for i in range(0, len(GOAL), solver2021.COLS)])
+    for board in [GOAL[:-1] + [1], GOAL[:-1], [], [[]]]:
+        with pytest.raises(Exception, match="exactly once"):
+            solver2021.check_solvable(board)
+    for board in [GOAL[:-1], []]:
+        with pytest.raises(Exception, match="tiles"):
+            solver2021.pack_board(board)
+
+def test_transposition_table_evicts_oldest():
+    # Room for 8 entries, dropping 2 at a time.
+    table = solver2021.TranspositionTable(8 * solver2021.TRANSPOSITION_ENTRY_BYTES / (1024 * 1024), 0.25)
+    for state in range(8):
+        table.put(state, state)
+    assert table.is_dominated(3, 3) and table.is_dominated(3, 4) and not table.is_dominated(3, 2)
+    # Updating an entry makes it the newest one.
+    table.put(0, 0)
+    table.put(8, 8)
+    assert table.evictions == 2
+    assert not table.is_dominated(1, 100) and not table.is_dominated(2, 100)
+    assert table.is_dominated(0, 0) and table.is_dominated(8, 8)
+    assert len(table.entries) == 7
+
+# Optimal lengths of SCRAMBLES, found by the default A* engine.
+@pytest.fixture(scope="module")
+def optimal_lengths():
+    lengths = {}
+    for scramble in SCRAMBLES:
+        (route, _) = solver2021.solve_astar(get_board(scramble))
+        check_route(get_board(scramble), route)
+        assert len(route) <= len(scramble.split())
+        lengths[scramble] = len(route)
+    return lengths
+
+@pytest.mark.parametrize("scramble", SCRAMBLES)
+def test_ida(scramble, optimal_lengths):
+    (route, _) = solver2021.solve_ida(get_board(scramble))
+    check_route(get_board(scramble), route)
+    assert len(route) == optimal_lengths[scramble]
+
+@pytest.mark.parametrize("scramble", SCRAMBLES)
+def test_anytime(scramble, optimal_lengths):
+    results = list(solver2021.solve_anytime(get_board(scramble), budget_ms=60000))
+    for result in results:
+        check_route(get_board(scramble), result["moves"])
+        assert result["length"] <= result["suboptimality"] * optimal_lengths[scramble] + 1e-9
+    assert results[-1]["suboptimality"] <= 1
+    assert results[-1]["length"] == optimal_lengths[scramble]
+
+@pytest.mark.parametrize("scramble", SCRAMBLES)
+def test_hda(scramble, optimal_lengths):
+    (route, _) = parallel_solver.solve_hda(get_board(scramble), workers=2)
+    check_route(get_board(scramble), route)
+    assert len(route) == optimal_lengths[scramble]
+
+# A worker that dies must fail the search instead of leaving the main process waiting for it.
+def test_hda_worker_failure(monkeypatch):
+    def expand(self, elem):
+        raise(Exception("expand failed"))
+    monkeypatch.setattr(parallel_solver.Worker, "expand", expand)
+    with pytest.raises(Exception, match="exited early"):
+        parallel_solver.solve_hda(get_board(SCRAMBLES[2]), workers=2)
+
+# A pattern database holds exact distances of the abstract puzzle: 0 for the goal placement, and elsewhere one more
+# than the best placement a move leads to.
+def test_pattern_db_is_exact():
+    database = solver2021.get_pattern_db()
+    rng = random.Random(5)
+    dests = [[move[1].index(cell) for cell in range(pattern_db.CELLS)] for move in solver2021.MOVES]
+    for i in range(len(database.patterns)):
+        goal = [tile - 1 for tile in database.patterns[i]]
+        assert database.lookup(i, goal) == 0
+        for _ in range(500):
+            positions = rng.sample(range(pattern_db.CELLS), len(goal))
+            if positions == goal:
+                continue
+            best = min([database.lookup(i, [dest[position] for position in positions]) for dest in dests])
+            assert database.lookup(i, positions) == best + 1
+
+def test_pattern_db_rebuilds_truncated_file(tmp_path):
+    path = str(tmp_path / "pattern_db.bin")
+    perms = [move[1] for move in solver2021.MOVES]
+    patterns = [(1, 2), (3,)]
+    pattern_db.build_pattern_db(path, perms, patterns)
+    size = len(open(path, "rb").read())
+    with open(path, "r+b") as file:
+        file.truncate(size - 100)
+    database = pattern_db.load_pattern_db(path, perms, patterns)
+    assert database.complete and len(database.data) == size
+    assert database.lookup(0, [0, 1]) == 0
+
+def test_batch_solver_pool(optimal_lengths):
+    text = "\n".join([" ".join(map(str, solver2021.make_moves(GOAL, scramble))) for scramble in SCRAMBLES[:3]])
+    boards = batch_solver.read_boards(io.StringIO(text))
+    results = sorted(batch_solver.solve_boards(boards, workers=2), key=lambda result: result["index"])
+    assert [result["index"] for result in results] == [0, 1, 2]
+    for (scramble, result) in zip(SCRAMBLES, results):
+        check_route(get_board(scramble), result["moves"])
+        assert result["length"] == optimal_lengths[scramble]
+    with pytest.raises(Exception):
+        batch_solver.read_boards(io.StringIO("1 2 3"))
+
+@pytest.mark.parametrize("engine", ["astar", "ida", "anytime", "hda"])
+def test_batch_solver_command_line(engine, optimal_lengths):
+    board = " ".join(map(str, solver2021.make_moves(GOAL, SCRAMBLES[1])))
+    output = subprocess.run([sys.executable, "batch_solver.py", "--workers", "1", "--engine", engine], input=board,
+                            capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    result = json.loads(output)
+    check_route(get_board(SCRAMBLES[1]), result["moves"])
+    assert result["length"] == optimal_lengths[SCRAMBLES[1]]
+
+# The frontier pops by lowest f, then lowest tie breaker, and the last pushed item among equals first.
+def test_bucket_frontier_order():
+    rng = random.Random(8)
+    frontier = solver2021.BucketFrontier()
+    reference = []
+    for step in range(2000):
+        if reference and rng.random() < 0.4:
+            expected = min(reference, key=lambda item: (item[0], item[1], -item[2]))
+            reference.remove(expected)
+            assert frontier.pop() == expected[2]
+        else:
+            (f, tie) = (rng.randrange(30), rng.randrange(10))
+            frontier.push(step, f, tie)
+            reference.append((f, tie, step))
+        assert len(frontier) == len(reference)
+
+# Nodes of the arena only store their parent index and move code; rebuild_path walks them back to the root.
+def test_rebuild_path_from_arena():
+    # root -> 1 (U1) -> 2 (R2) -> 4 (L3), and a sibling branch 3 under root.
+    parents = array("l", [-1, 0, 1, 0, 2])
+    moves = bytearray([0, 4, 1, 7, 2])
+    assert solver2021.rebuild_path(parents, moves, 4) == ["U1", "R2", "L3"]
+    assert solver2021.rebuild_path(parents, moves, 3) == ["D4"]
+    assert solver2021.rebuild_path(parents, moves, 0) == []
+
+# The NumPy batch must score the 9 successors exactly like the Python path.
+def test_numpy_scores_match_python():
+    if solver2021.np is None:
+        pytest.skip("NumPy is not installed")
+    for board in get_random_boards(50, 20, 10):
+        tiles = solver2021.unpack_board(board)
+        heuristic_state = solver2021.get_heuristic_state(tiles)
+        expected = [solver2021.get_successor_heuristic(heuristic_state, move) for move in solver2021.MOVES]
+        assert solver2021.get_successor_scores_numpy(tiles) == expected
+
+# Distances in the endgame table must be those of a breadth first search: 0 at the goal only, and elsewhere one
+# more than the best successor, as long as that successor is in the table.
+def test_endgame_table_is_exact():
+    endgame = solver2021.get_endgame_table()
+    assert endgame.get(solver2021.GOAL_STATE) == 0
+    previous = -1
+    for (board, distance) in list(endgame.items())[::7]:
+        assert board > previous
+        previous = board
+        if distance == 0:
+            assert board == solver2021.GOAL_STATE
+            continue
+        succ_distances = [endgame.get(solver2021.apply_move(board, move)) for move in solver2021.MOVES]
+        assert min([d for d in succ_distances if d is not None]) == distance - 1
+    for board in get_random_boards(200, 20, 11):
+        heuristic_state = solver2021.get_heuristic_state(solver2021.unpack_board(board))
+        if solver2021.get_state_h(heuristic_state) > endgame.depth:
+            assert endgame.get(board) is None
+
+def test_endgame_table_rebuilds_truncated_file(tmp_path):
+    path = str(tmp_path / "endgame.bin")
+    endgame_table.load_endgame_table(path, solver2021.GOAL_STATE, solver2021.get_predecessors, 2).data.close()
+    size = len(open(path, "rb").read())
+    with open(path, "r+b") as file:
+        file.truncate(size - 3)
+    table = endgame_table.load_endgame_table(path, solver2021.GOAL_STATE, solver2021.get_predecessors, 2)
+    assert table.complete and len(open(path, "rb").read()) == size
+    assert len(table) == 1 + 9 + len([board for (board, distance) in table.items() if distance == 2])
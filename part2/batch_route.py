@@ -0,0 +1,72 @@
+#!/usr/local/bin/python3
+# batch_route.py : Answer many route queries in one run
+#
+# Queries are read from a file (or stdin when no file, or "-", is given), one per line as "start-city end-city cost".
+# The road graph is loaded once and one JSON line is printed per query as soon as it is answered:
+#   {"index": 0, "start": "...", "end": "...", "cost": "distance", "total-segments": 3, ..., "route-taken": [...]}
+#
+# With --workers N > 1 the queries are spread over a pool of N processes. The graph is loaded before the pool is
+# forked, so the workers share the memory-mapped snapshot, hierarchies and landmark tables instead of loading (or
+# building) their own copy.
+#
+# Usage: python3 batch_route.py [queries.txt] [--workers N]
+#
+
+import argparse
+import json
+import multiprocessing
+import sys
+
+import road_graph
+import route
+
+def read_queries(file):
+    queries = []
+    for line in file:
+        attribs = line.split()
+        if not attribs:
+            continue
+        if len(attribs) != 3:
+            raise(Exception("Error: expected start city, end city and cost function in: " + line.strip()))
+        if attribs[2] not in road_graph.COSTS:
+            raise(Exception("Error: invalid cost function " + attribs[2]))
+        queries.append(tuple(attribs))
+    return queries
+
+def answer_query(job):
+    (index, (start, end, cost)) = job
+    result = {"index": index, "start": start, "end": end, "cost": cost}
+    try:
+        result.update(route.get_engine().route(start, end, cost))
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+# Yields the results in query order when run in this process, or in the order they finish with a pool.
+def answer_queries(queries, workers=1):
+    route.get_engine().preload(set([query[2] for query in queries]))
+    if workers is None or workers <= 1:
+        for job in enumerate(queries):
+            yield answer_query(job)
+        return
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with context.Pool(workers) as pool:
+        for result in pool.imap_unordered(answer_query, enumerate(queries), chunksize=16):
+            yield result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer many route queries and print one JSON line per query.")
+    parser.add_argument("queries", nargs="?", default="-", help="query file, or - for stdin")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (default: answer in this process)")
+    args = parser.parse_args()
+
+    if args.queries == "-":
+        queries = read_queries(sys.stdin)
+    else:
+        with open(args.queries, "r") as file:
+            queries = read_queries(file)
+
+    for result in answer_queries(queries, args.workers):
+        print(json.dumps(result), flush=True)
@@ -0,0 +1,301 @@
+#!/usr/local/bin/python3
+# contraction.py : Contraction hierarchies for the road graph
+#
+# Cities are contracted one at a time, cheapest first (by edge difference). Contracting a city removes it from the
+# graph and adds a shortcut between two of its remaining neighbours whenever the path through the city is shorter
+# than any other path between them (a bounded Dijkstra looks for such a witness path). Every city then keeps the
+# "upward" arcs to the neighbours it had when it was contracted, and a shortest path is found by two small Dijkstra
+# searches that only follow upward arcs, one from each end, meeting at the highest city of the path.
+#
+# Every shortcut remembers the city it skipped, so a route on the hierarchy is unpacked back into the roads of the
+# original graph. Roads are two way, so one set of upward arcs serves both searches.
+#
+# One hierarchy is built per cost function and saved next to road-graph.bin, offline since it takes seconds per cost
+# function: python3 contraction.py. route.py only maps hierarchies that match the current snapshot, and answers
+# queries on the road graph itself until they are built again.
+#
+
+import heapq
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import road_graph
+
+MAGIC = b"RCH1"
+PATH_FORMAT = "road-graph-ch-%s.bin"
+
+# Bounds on the witness search: a missing witness only costs an extra shortcut, never a wrong route.
+WITNESS_SETTLE_LIMIT = 200
+
+INFINITY = float("inf")
+
+# (name, typecode) of every section, in file order. The arcs of city u are up_offsets[u] .. up_offsets[u + 1]; an
+# arc is a road when up_middle is -1 (up_edge and up_reverse are then the edge ids for both directions), or else a
+# shortcut through the city up_middle.
+SECTIONS = [("rank", "I"), ("up_offsets", "I"), ("up_targets", "I"), ("up_weights", "d"), ("up_middle", "i"),
+            ("up_edge", "I"), ("up_reverse", "I")]
+
+# MAGIC, fingerprint of the snapshot, then (offset, length) of every section.
+HEADER_FORMAT = "<4s20s" + "QQ" * len(SECTIONS)
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+def get_hierarchy_path(cost):
+    return PATH_FORMAT % cost
+
+# Distances from source in the remaining graph, without going through skip. Stops once every target is settled,
+# distances go over limit, or WITNESS_SETTLE_LIMIT cities are settled.
+def find_witness_distances(adjacency, source, skip, targets, limit):
+    distances = {source: 0}
+    que = [(0, source)]
+    settled = 0
+    left = len(targets)
+    while que and settled < WITNESS_SETTLE_LIMIT:
+        (distance, city) = heapq.heappop(que)
+        if distance > distances[city]:
+            continue
+        if distance > limit:
+            break
+        settled += 1
+        if city in targets:
+            left -= 1
+            if left == 0:
+                break
+        for (neighbour, arc) in adjacency[city].items():
+            if neighbour == skip:
+                continue
+            new_distance = distance + arc[0]
+            if new_distance < distances.get(neighbour, INFINITY):
+                distances[neighbour] = new_distance
+                heapq.heappush(que, (new_distance, neighbour))
+    return distances
+
+# Shortcuts (u, w, weight) needed to contract city.
+def get_shortcuts(adjacency, city):
+    neighbours = list(adjacency[city].items())
+    shortcuts = []
+    for i in range(len(neighbours)):
+        (u, arc_u) = neighbours[i]
+        targets = {}
+        for j in range(i + 1, len(neighbours)):
+            (w, arc_w) = neighbours[j]
+            targets[w] = arc_u[0] + arc_w[0]
+        if not targets:
+            continue
+        distances = find_witness_distances(adjacency, u, city, targets, max(targets.values()))
+        for w in targets:
+            if distances.get(w, INFINITY) > targets[w]:
+                shortcuts.append((u, w, targets[w]))
+    return shortcuts
+
+def get_priority(adjacency, city, deleted):
+    return len(get_shortcuts(adjacency, city)) - len(adjacency[city]) + deleted[city]
+
+# Returns the sections of the hierarchy of graph under cost.
+def build_hierarchy(graph, cost):
+    weights = graph.get_weights(cost)
+    size = len(graph)
+
+    # adjacency[u][v] = (weight, middle, edge): the cheapest road or shortcut between u and v that is still in the
+    # graph. middle is -1 for a road, whose edge id from u to v is edge.
+    adjacency = [{} for _ in range(size)]
+    for u in range(size):
+        for edge in range(graph.edge_offsets[u], graph.edge_offsets[u + 1]):
+            v = graph.edge_targets[edge]
+            if v != u and (v not in adjacency[u] or weights[edge] < adjacency[u][v][0]):
+                adjacency[u][v] = (weights[edge], -1, edge)
+
+    deleted = [0] * size
+    que = [(get_priority(adjacency, city, deleted), city) for city in range(size)]
+    heapq.heapify(que)
+
+    rank = array("I", [0] * size)
+    upward = [None] * size
+    order = 0
+    while que:
+        (priority, city) = heapq.heappop(que)
+        # Lazy update: the priority may be stale, so it is computed again and the city waits if it got worse.
+        priority = get_priority(adjacency, city, deleted)
+        if que and priority > que[0][0]:
+            heapq.heappush(que, (priority, city))
+            continue
+
+        for (u, w, weight) in get_shortcuts(adjacency, city):
+            if w not in adjacency[u] or weight < adjacency[u][w][0]:
+                adjacency[u][w] = (weight, city, 0)
+                adjacency[w][u] = (weight, city, 0)
+        upward[city] = [(v, arc, adjacency[v][city]) for (v, arc) in adjacency[city].items()]
+        for v in adjacency[city]:
+            del adjacency[v][city]
+            deleted[v] += 1
+        adjacency[city] = {}
+        rank[city] = order
+        order += 1
+
+    sections = {"rank": rank, "up_offsets": array("I", [0]), "up_targets": array("I"), "up_weights": array("d"),
+                "up_middle": array("i"), "up_edge": array("I"), "up_reverse": array("I")}
+    for city in range(size):
+        for (v, arc, reverse) in upward[city]:
+            sections["up_targets"].append(v)
+            sections["up_weights"].append(arc[0])
+            sections["up_middle"].append(arc[1])
+            sections["up_edge"].append(arc[2])
+            sections["up_reverse"].append(reverse[2])
+        sections["up_offsets"].append(len(sections["up_targets"]))
+    return sections
+
+def save_hierarchy(path, graph, sections):
+    body = bytearray()
+    layout = []
+    for (name, _) in SECTIONS:
+        data = bytes(sections[name])
+        body += b"\0" * (-(HEADER_SIZE + len(body)) % 8)
+        layout += [HEADER_SIZE + len(body), len(data)]
+        body += data
+    # The temporary name is unique to this process, so processes building the same hierarchy don't clash.
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "wb") as file:
+        file.write(struct.pack(HEADER_FORMAT, MAGIC, graph.fingerprint, *layout) + body)
+    os.replace(tmp_path, path)
+
+class ContractionHierarchy:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = struct.unpack(HEADER_FORMAT, self.data[:HEADER_SIZE])
+        if fields[0] != MAGIC:
+            raise(Exception("Error: " + path + " is not a contraction hierarchy"))
+        self.fingerprint = fields[1]
+
+        self.view = memoryview(self.data)
+        layout = fields[2:]
+        for (i, (name, typecode)) in enumerate(SECTIONS):
+            setattr(self, name, self.view[layout[2 * i]:layout[2 * i] + layout[2 * i + 1]].cast(typecode))
+
+        # arcs[(u, v)] = the arc from the lower ranked u to v, used to unpack shortcuts.
+        self.arcs = {}
+        for u in range(len(self.rank)):
+            for arc in range(self.up_offsets[u], self.up_offsets[u + 1]):
+                self.arcs[(u, self.up_targets[arc])] = arc
+
+    # The map can only be closed once no view into it is left, or mmap raises BufferError.
+    def close(self):
+        for (name, _) in SECTIONS:
+            getattr(self, name).release()
+        self.view.release()
+        self.data.close()
+
+    def get_arc(self, u, v):
+        if self.rank[u] < self.rank[v]:
+            return self.arcs[(u, v)]
+        return self.arcs[(v, u)]
+
+    # Appends to edges the roads of arc, driven upward (from its lower ranked city) or downward.
+    def unpack(self, arc, upward, edges):
+        stack = [(arc, upward)]
+        while stack:
+            (arc, upward) = stack.pop()
+            middle = self.up_middle[arc]
+            if middle == -1:
+                edges.append(self.up_edge[arc] if upward else self.up_reverse[arc])
+                continue
+            # A shortcut from source to target through middle, whose rank is lower than both. The stack is last in
+            # first out, so the second half of the route is pushed first.
+            to_target = self.get_arc(middle, self.up_targets[arc])
+            to_source = self.get_arc(middle, self.arc_source(arc))
+            if upward:
+                stack += [(to_target, True), (to_source, False)]
+            else:
+                stack += [(to_source, True), (to_target, False)]
+
+    def arc_source(self, arc):
+        # up_offsets is sorted, so the source of an arc is found by binary search.
+        (low, high) = (0, len(self.rank))
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self.up_offsets[middle] <= arc:
+                low = middle
+            else:
+                high = middle
+        return low
+
+    # Returns (cost, edges) of a shortest route from source to target, or (None, []) if there is none.
+    def query(self, source, target):
+        if source == target:
+            return (0, [])
+        distances = ({source: 0}, {target: 0})
+        parents = ({source: -1}, {target: -1})
+        ques = ([(0, source)], [(0, target)])
+        best = INFINITY
+        meeting = -1
+        while ques[0] or ques[1]:
+            for side in (0, 1):
+                que = ques[side]
+                if not que:
+                    continue
+                (distance, city) = heapq.heappop(que)
+                if distance > distances[side][city]:
+                    continue
+                # Nothing left on this side can lead to a shorter route.
+                if distance >= best:
+                    que.clear()
+                    continue
+                other = distances[1 - side].get(city)
+                if other is not None and distance + other < best:
+                    best = distance + other
+                    meeting = city
+                for arc in range(self.up_offsets[city], self.up_offsets[city + 1]):
+                    neighbour = self.up_targets[arc]
+                    new_distance = distance + self.up_weights[arc]
+                    if new_distance < distances[side].get(neighbour, INFINITY):
+                        distances[side][neighbour] = new_distance
+                        parents[side][neighbour] = arc
+                        heapq.heappush(que, (new_distance, neighbour))
+        if meeting == -1:
+            return (None, [])
+
+        # source climbs up to the meeting city, then the route climbs down to target.
+        arcs = []
+        city = meeting
+        while parents[0][city] != -1:
+            arcs.append(parents[0][city])
+            city = self.arc_source(parents[0][city])
+        edges = []
+        for arc in reversed(arcs):
+            self.unpack(arc, True, edges)
+        city = meeting
+        while parents[1][city] != -1:
+            arc = parents[1][city]
+            self.unpack(arc, False, edges)
+            city = self.arc_source(arc)
+        return (best, edges)
+
+# Maps the hierarchy of graph under cost, or returns None if it is missing or was built from another snapshot.
+def open_hierarchy(graph, cost, path=None):
+    path = path or get_hierarchy_path(cost)
+    if not os.path.exists(path):
+        return None
+    hierarchy = ContractionHierarchy(path)
+    if hierarchy.fingerprint == graph.fingerprint:
+        return hierarchy
+    hierarchy.close()
+    return None
+
+# Maps the hierarchy of graph under cost, building it first if it is missing or was built from another snapshot.
+def load_hierarchy(graph, cost, path=None):
+    path = path or get_hierarchy_path(cost)
+    hierarchy = open_hierarchy(graph, cost, path)
+    if hierarchy is not None:
+        return hierarchy
+    save_hierarchy(path, graph, build_hierarchy(graph, cost))
+    return ContractionHierarchy(path)
+
+if __name__ == "__main__":
+    graph = road_graph.load_graph()
+    for cost in sys.argv[1:] or road_graph.COSTS:
+        sections = build_hierarchy(graph, cost)
+        save_hierarchy(get_hierarchy_path(cost), graph, sections)
+        print("Hierarchy for %s with %d arcs written to %s" % (cost, len(sections["up_targets"]),
+                                                                get_hierarchy_path(cost)))
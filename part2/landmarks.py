@@ -0,0 +1,172 @@
+#!/usr/local/bin/python3
+# landmarks.py : ALT (A*, landmarks, triangle inequality) heuristic for the road graph
+#
+# For a few landmark cities L the exact cost d(L, v) to every city v is computed once. Roads are two way, so by the
+# triangle inequality |d(L, goal) - d(L, v)| is a lower bound on the cost from v to the goal, and the max over all
+# landmarks is an admissible and consistent heuristic. Unlike the great circle distance it doesn't depend on the GPS
+# data at all, so it is also exact about cities without coordinates.
+#
+# Some cities are not connected to the rest of the map. Every connected component with more than one city gets its
+# own landmarks (the big one gets LANDMARK_COUNT of them), picked one at a time as the city farthest from the
+# landmarks picked so far. Each landmark only bounds cities of its own component, and a route between two components
+# is known to be impossible without searching.
+#
+# One table is built per cost function and saved next to road-graph.bin. It is built again when the snapshot it was
+# built from changes. To (re)build all of them run: python3 landmarks.py
+#
+
+import heapq
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import road_graph
+
+MAGIC = b"ALT1"
+PATH_FORMAT = "road-graph-alt-%s.bin"
+LANDMARK_COUNT = 16
+
+INFINITY = float("inf")
+
+# MAGIC, fingerprint of the snapshot, number of cities, number of landmarks, then the component of every city (I),
+# the landmarks (I) and the distances from every landmark to every city (d, one row per landmark).
+HEADER_FORMAT = "<4s20sII"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+def get_landmarks_path(cost):
+    return PATH_FORMAT % cost
+
+# Component id of every city, and the cities of every component.
+def get_components(graph):
+    component = array("I", [0] * len(graph))
+    members = []
+    seen = bytearray(len(graph))
+    for city in range(len(graph)):
+        if seen[city]:
+            continue
+        seen[city] = 1
+        stack = [city]
+        cities = []
+        while stack:
+            u = stack.pop()
+            component[u] = len(members)
+            cities.append(u)
+            for edge in range(graph.edge_offsets[u], graph.edge_offsets[u + 1]):
+                if not seen[graph.edge_targets[edge]]:
+                    seen[graph.edge_targets[edge]] = 1
+                    stack.append(graph.edge_targets[edge])
+        members.append(cities)
+    return (component, members)
+
+# Dijkstra from source over the whole graph. Cities that can't be reached keep INFINITY.
+def get_distances(graph, weights, source):
+    distances = array("d", [INFINITY]) * len(graph)
+    distances[source] = 0
+    que = [(0, source)]
+    while que:
+        (distance, city) = heapq.heappop(que)
+        if distance > distances[city]:
+            continue
+        for edge in range(graph.edge_offsets[city], graph.edge_offsets[city + 1]):
+            new_distance = distance + weights[edge]
+            if new_distance < distances[graph.edge_targets[edge]]:
+                distances[graph.edge_targets[edge]] = new_distance
+                heapq.heappush(que, (new_distance, graph.edge_targets[edge]))
+    return distances
+
+# Returns (component, landmarks, rows), rows[i] being the distances from landmarks[i].
+def build_landmarks(graph, cost):
+    weights = graph.get_weights(cost)
+    (component, members) = get_components(graph)
+    largest = max(range(len(members)), key=lambda i: len(members[i]))
+
+    landmarks = []
+    rows = []
+    for i in range(len(members)):
+        if len(members[i]) < 2:
+            continue
+        # The first landmark is the city farthest from an arbitrary one, every next one the city farthest from all
+        # landmarks of the component so far.
+        nearest = get_distances(graph, weights, members[i][0])
+        for j in range(LANDMARK_COUNT if i == largest else 1):
+            landmark = max(members[i], key=lambda city: nearest[city])
+            if j > 0 and nearest[landmark] == 0:
+                break
+            landmarks.append(landmark)
+            rows.append(get_distances(graph, weights, landmark))
+            nearest = rows[-1] if j == 0 else array("d", map(min, nearest, rows[-1]))
+    return (component, landmarks, rows)
+
+def save_landmarks(path, graph, component, landmarks, rows):
+    # The temporary name is unique to this process, so processes building the same table don't clash.
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "wb") as file:
+        file.write(struct.pack(HEADER_FORMAT, MAGIC, graph.fingerprint, len(graph), len(landmarks)))
+        file.write(bytes(component))
+        file.write(bytes(array("I", landmarks)))
+        # Keeps the distances on an 8 byte boundary so they can be cast in place.
+        file.write(b"\0" * (-(HEADER_SIZE + 4 * (len(graph) + len(landmarks))) % 8))
+        for row in rows:
+            file.write(bytes(row))
+    os.replace(tmp_path, path)
+
+class LandmarkTable:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.fingerprint, size, count) = struct.unpack(HEADER_FORMAT, self.data[:HEADER_SIZE])
+        if magic != MAGIC:
+            raise(Exception("Error: " + path + " is not a landmark table"))
+
+        self.view = memoryview(self.data)
+        offset = HEADER_SIZE
+        self.component = self.view[offset:offset + 4 * size].cast("I")
+        offset += 4 * size
+        self.landmarks = self.view[offset:offset + 4 * count].cast("I")
+        offset += 4 * count
+        offset += -offset % 8
+        self.rows = [self.view[offset + 8 * size * i:offset + 8 * size * (i + 1)].cast("d") for i in range(count)]
+        self.goal_rows = []
+
+    # The map can only be closed once no view into it is left, or mmap raises BufferError.
+    def close(self):
+        self.goal_rows = []
+        for view in [self.component, self.landmarks] + self.rows + [self.view]:
+            view.release()
+        self.data.close()
+
+    def is_reachable(self, source, target):
+        return self.component[source] == self.component[target]
+
+    # Keeps the landmarks that bound routes to goal (the ones of its component), with their distance to goal.
+    def set_goal(self, goal):
+        self.goal_rows = [(row, row[goal]) for row in self.rows if row[goal] != INFINITY]
+
+    # Lower bound on the cost from city to the goal given to set_goal.
+    def get_lower_bound(self, city):
+        bound = 0
+        for (row, goal_distance) in self.goal_rows:
+            difference = abs(goal_distance - row[city])
+            if difference > bound:
+                bound = difference
+        return bound
+
+# Maps the table of graph under cost, building it first if it is missing or was built from another snapshot.
+def load_landmarks(graph, cost, path=None):
+    path = path or get_landmarks_path(cost)
+    if os.path.exists(path):
+        table = LandmarkTable(path)
+        if table.fingerprint == graph.fingerprint:
+            return table
+        table.close()
+    save_landmarks(path, graph, *build_landmarks(graph, cost))
+    return LandmarkTable(path)
+
+if __name__ == "__main__":
+    graph = road_graph.load_graph()
+    for cost in sys.argv[1:] or road_graph.COSTS:
+        (component, landmarks, rows) = build_landmarks(graph, cost)
+        save_landmarks(get_landmarks_path(cost), graph, component, landmarks, rows)
+        print("%d landmarks for %s written to %s" % (len(landmarks), cost, get_landmarks_path(cost)))
@@ -0,0 +1,102 @@
+#!/usr/local/bin/python3
+# pareto.py : Routes that are Pareto optimal over miles, hours and expected accidents
+#
+# A multi-criteria label setting search (Martins' algorithm). A label is one route to a city, with its (miles,
+# hours, accidents). Labels are settled in lexicographic order of the three values, and a label is dropped when a
+# label already settled at its city, or at the target, is at least as good in all three (dominance pruning). The
+# labels settled at the target are then the Pareto front: no route is better in all three than any of them.
+#
+# bounds, when given, are consistent lower bounds on the miles, hours and accidents from every city to the target (inf
+# when the target can't be reached). Labels are then settled in lexicographic order of their values plus the bounds,
+# as in multi-objective A*, so the target is reached straight away, and a label is dropped if, with the bounds added,
+# a label settled at the target is at least as good. Consistent bounds keep the labels of a city settled in
+# lexicographic order of their own values, so the dominance rules still hold.
+#
+# The front can grow large, so every city settles at most PARETO_LABEL_CAP labels. Past the cap a label is only kept
+# if it beats every label settled at the city in hours or in accidents. So the front may miss some compromise routes,
+# but the cheapest route in each of the three criteria is always found.
+#
+# Usage: python3 pareto.py start-city end-city
+#
+
+import heapq
+import sys
+
+PARETO_LABEL_CAP = 20
+INFINITY = float("inf")
+
+# True if one of labels, (miles, hours, accidents, ...) tuples, is at least as good in all three.
+def is_dominated(labels, miles, hours, accidents):
+    for label in labels:
+        if label[0] <= miles and label[1] <= hours and label[2] <= accidents:
+            return True
+    return False
+
+# Labels of a city arrive in lexicographic order, so a new label can't have fewer miles than the settled ones.
+def is_improving(labels, hours, accidents):
+    return hours < min(label[1] for label in labels) or accidents < min(label[2] for label in labels)
+
+# Returns the Pareto front of routes from source to target (city ids) as (miles, hours, accidents, edges) tuples,
+# sorted by miles.
+def find_pareto_routes(graph, source, target, bounds=None, cap=PARETO_LABEL_CAP):
+    if bounds is None:
+        bounds = [[0] * len(graph)] * 3
+    (miles_bounds, hours_bounds, accidents_bounds) = bounds
+    # Every label ever created is kept as (city, parent label, edge from the parent, miles, hours, accidents), so a
+    # route is rebuilt by following the parents. The fringe holds (miles, hours, accidents) plus the bounds.
+    arena = [(source, -1, -1, 0, 0, 0)]
+    settled = [[] for _ in range(len(graph))]
+    que = [(miles_bounds[source], hours_bounds[source], accidents_bounds[source], 0)]
+    while que:
+        (miles_f, hours_f, accidents_f, label) = heapq.heappop(que)
+        (city, _, _, miles, hours, accidents) = arena[label]
+        if is_dominated(settled[target], miles_f, hours_f, accidents_f) or \
+                is_dominated(settled[city], miles, hours, accidents):
+            continue
+        if len(settled[city]) >= cap and not is_improving(settled[city], hours, accidents):
+            continue
+        settled[city].append((miles, hours, accidents, label))
+        if city == target:
+            continue
+
+        for edge in range(graph.edge_offsets[city], graph.edge_offsets[city + 1]):
+            dest = graph.edge_targets[edge]
+            new_miles = miles + graph.edge_lengths[edge]
+            new_hours = hours + graph.weight_time[edge]
+            new_accidents = accidents + graph.weight_safe[edge]
+            if miles_bounds[dest] == INFINITY:
+                continue
+            if is_dominated(settled[dest], new_miles, new_hours, new_accidents) or \
+                    is_dominated(settled[target], new_miles + miles_bounds[dest], new_hours + hours_bounds[dest],
+                                 new_accidents + accidents_bounds[dest]):
+                continue
+            arena.append((dest, label, edge, new_miles, new_hours, new_accidents))
+            heapq.heappush(que, (new_miles + miles_bounds[dest], new_hours + hours_bounds[dest],
+                                 new_accidents + accidents_bounds[dest], len(arena) - 1))
+
+    routes = []
+    for (miles, hours, accidents, label) in settled[target]:
+        edges = []
+        while arena[label][1] != -1:
+            edges.append(arena[label][2])
+            label = arena[label][1]
+        edges.reverse()
+        routes.append((miles, hours, accidents, edges))
+    return routes
+
+if __name__ == "__main__":
+    import route
+
+    if len(sys.argv) != 3:
+        raise(Exception("Error: expected 2 arguments"))
+    result = route.get_engine().route_pareto(sys.argv[1], sys.argv[2])
+    for cost in ("distance", "time", "safe"):
+        route_info = result[cost]
+        print("Best %-8s %4d segments %10.3f miles %8.3f hours %12.8f accidents" %
+              (cost + ":", route_info["total-segments"], route_info["total-miles"], route_info["total-hours"],
+               route_info["total-expected-accidents"]))
+    print("\nPareto front (%d routes):" % len(result["pareto-front"]))
+    for route_info in result["pareto-front"]:
+        print("   %4d segments %10.3f miles %8.3f hours %12.8f accidents" %
+              (route_info["total-segments"], route_info["total-miles"], route_info["total-hours"],
+               route_info["total-expected-accidents"]))
@@ -0,0 +1,221 @@
+#!/usr/local/bin/python3
+# road_graph.py : Binary snapshot of the road network
+#
+# city-gps.txt and road-segments.txt are compiled once into road-graph.bin, which holds the network as flat arrays:
+#   - an interned table of city names, and the latitude/longitude of every city (NaN when unknown),
+#   - the roads in CSR form: edge_offsets[city] .. edge_offsets[city + 1] index the roads leaving the city, with their
+#     target city, length, speed limit and highway name id (every road is stored once in each direction),
+#   - an interned table of highway names,
+#   - the weight of every road under each cost function (see COSTS), computed once here so the search only adds floats,
+#   - a grid over the coordinates of the cities for nearest city lookups (see spatial_index.py).
+# The snapshot is memory-mapped, so loading it costs almost nothing. It is compiled again when the modification time
+# or the size of a source file changes and its SHA-1 doesn't match the one recorded in the snapshot.
+#
+# To (re)build the snapshot run: python3 road_graph.py
+#
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+from array import array
+
+import spatial_index
+
+MAGIC = b"RGS1"
+VERSION = 3
+CITY_FILE = "city-gps.txt"
+ROAD_FILE = "road-segments.txt"
+SNAPSHOT_PATH = "road-graph.bin"
+
+# (name, typecode) of every section, in file order. Typecode "s" is a utf-8 blob.
+SECTIONS = [("city_names", "s"), ("city_name_offsets", "I"), ("lat", "d"), ("lng", "d"),
+            ("edge_offsets", "I"), ("edge_targets", "I"), ("edge_lengths", "d"), ("edge_speeds", "d"),
+            ("edge_highways", "I"), ("highway_names", "s"), ("highway_name_offsets", "I"),
+            ("weight_segments", "d"), ("weight_distance", "d"), ("weight_time", "d"), ("weight_safe", "d"),
+            ("grid_info", "d"), ("grid_offsets", "I"), ("grid_cities", "I")]
+
+COSTS = ("segments", "distance", "time", "safe")
+
+# Expected accidents per mile: 1 per million miles on interstates, twice that on other roads.
+def get_accidents(length, highway):
+    if highway[:2] == "I-":
+        return length / 1000000
+    return length * 2 / 1000000
+
+# MAGIC, VERSION, then (mtime in ns, size, sha1) of both source files, then (offset, length) of every section.
+SOURCE_FORMAT = "<qq20s"
+HEADER_FORMAT = "<4sI" + SOURCE_FORMAT[1:] * 2 + "QQ" * len(SECTIONS)
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+def get_file_hash(path):
+    with open(path, "rb") as file:
+        return hashlib.sha1(file.read()).digest()
+
+def get_source_info(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size, get_file_hash(path))
+
+# Names are stored back to back in one utf-8 blob, with offsets[i] .. offsets[i + 1] delimiting the i-th name.
+def intern_names(names):
+    blob = bytearray()
+    offsets = array("I", [0])
+    for name in names:
+        blob += name.encode("utf-8")
+        offsets.append(len(blob))
+    return (bytes(blob), offsets)
+
+def read_names(blob, offsets):
+    text = bytes(blob)
+    return [text[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+# Parses the two text files. Cities keep the order of city-gps.txt followed by the cities only found in
+# road-segments.txt, and the roads of a city keep the order of the file, as the search used to see them.
+def parse_sources(city_file, road_file):
+    ids = {}
+    lat = array("d")
+    lng = array("d")
+    with open(city_file) as file:
+        for line in file:
+            attribs = line.split()
+            if not attribs:
+                continue
+            # A city listed twice keeps its first position and its last coordinates.
+            if attribs[0] not in ids:
+                ids[attribs[0]] = len(ids)
+                lat.append(math.nan)
+                lng.append(math.nan)
+            lat[ids[attribs[0]]] = float(attribs[1]) if len(attribs) > 1 else math.nan
+            lng[ids[attribs[0]]] = float(attribs[2]) if len(attribs) > 2 else math.nan
+
+    highways = {}
+    roads = []
+    with open(road_file) as file:
+        for line in file:
+            attribs = line.split()
+            if not attribs:
+                continue
+            for city in attribs[:2]:
+                if city not in ids:
+                    ids[city] = len(ids)
+                    lat.append(math.nan)
+                    lng.append(math.nan)
+            highway = highways.setdefault(attribs[4], len(highways))
+            roads.append((ids[attribs[0]], ids[attribs[1]], float(attribs[2]), float(attribs[3]), highway))
+
+    edges = [[] for _ in range(len(ids))]
+    for (city1, city2, length, speed, highway) in roads:
+        edges[city1].append((city2, length, speed, highway))
+        edges[city2].append((city1, length, speed, highway))
+    return (list(ids), lat, lng, edges, list(highways))
+
+def compile_snapshot(path=SNAPSHOT_PATH, city_file=CITY_FILE, road_file=ROAD_FILE):
+    sources = [get_source_info(city_file), get_source_info(road_file)]
+    (cities, lat, lng, edges, highways) = parse_sources(city_file, road_file)
+
+    sections = {"lat": lat, "lng": lng}
+    (sections["city_names"], sections["city_name_offsets"]) = intern_names(cities)
+    (sections["highway_names"], sections["highway_name_offsets"]) = intern_names(highways)
+    sections["edge_offsets"] = array("I", [0])
+    sections["edge_targets"] = array("I")
+    sections["edge_lengths"] = array("d")
+    sections["edge_speeds"] = array("d")
+    sections["edge_highways"] = array("I")
+    for cost in COSTS:
+        sections["weight_" + cost] = array("d")
+    for city_edges in edges:
+        for (target, length, speed, highway) in city_edges:
+            sections["edge_targets"].append(target)
+            sections["edge_lengths"].append(length)
+            sections["edge_speeds"].append(speed)
+            sections["edge_highways"].append(highway)
+            sections["weight_segments"].append(1.0)
+            sections["weight_distance"].append(length)
+            sections["weight_time"].append(length / speed)
+            sections["weight_safe"].append(get_accidents(length, highways[highway]))
+        sections["edge_offsets"].append(len(sections["edge_targets"]))
+    (sections["grid_info"], sections["grid_offsets"], sections["grid_cities"]) = spatial_index.build_grid(lat, lng)
+
+    # Sections start on 8 byte boundaries so they can be cast in place.
+    body = bytearray()
+    layout = []
+    for (name, _) in SECTIONS:
+        data = bytes(sections[name])
+        body += b"\0" * (-(HEADER_SIZE + len(body)) % 8)
+        layout += [HEADER_SIZE + len(body), len(data)]
+        body += data
+
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, *[field for source in sources for field in source], *layout)
+    # Written under another name first, so a reader never maps a half written snapshot, and per process, so two
+    # processes compiling at once don't write into the same file.
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "wb") as file:
+        file.write(header + body)
+    os.replace(tmp_path, path)
+
+# A snapshot is fresh if it has this VERSION and both sources are unchanged: same mtime and size, or else same hash.
+def is_snapshot_fresh(path=SNAPSHOT_PATH, city_file=CITY_FILE, road_file=ROAD_FILE):
+    if not os.path.exists(path):
+        return False
+    with open(path, "rb") as file:
+        header = file.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE:
+        return False
+    fields = struct.unpack(HEADER_FORMAT, header)
+    if fields[0] != MAGIC or fields[1] != VERSION:
+        return False
+    for (i, source) in enumerate([city_file, road_file]):
+        (mtime, size, sha1) = fields[2 + i * 3:5 + i * 3]
+        stat = os.stat(source)
+        if (stat.st_mtime_ns, stat.st_size) != (mtime, size) and get_file_hash(source) != sha1:
+            return False
+    return True
+
+class RoadGraph:
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = struct.unpack(HEADER_FORMAT, self.data[:HEADER_SIZE])
+        if fields[0] != MAGIC:
+            raise(Exception("Error: " + path + " is not a road graph snapshot"))
+
+        # Identifies the sources the snapshot was compiled from, for the files derived from it.
+        self.fingerprint = hashlib.sha1(struct.pack("<I", VERSION) + fields[4] + fields[7]).digest()
+
+        view = memoryview(self.data)
+        layout = fields[8:]
+        for (i, (name, typecode)) in enumerate(SECTIONS):
+            section = view[layout[2 * i]:layout[2 * i] + layout[2 * i + 1]]
+            setattr(self, name, section if typecode == "s" else section.cast(typecode))
+
+        self.names = read_names(self.city_names, self.city_name_offsets)
+        self.ids = {self.names[i]: i for i in range(len(self.names))}
+        self.highways = read_names(self.highway_names, self.highway_name_offsets)
+        self.max_length = max(self.edge_lengths)
+        self.max_speed = max(self.edge_speeds)
+
+    def __len__(self):
+        return len(self.names)
+
+    def has_gps(self, city):
+        return not math.isnan(self.lat[city])
+
+    # Edge weights for one of COSTS, indexed like edge_targets.
+    def get_weights(self, cost):
+        if cost not in COSTS:
+            raise(Exception("Error: invalid cost function"))
+        return getattr(self, "weight_" + cost)
+
+# Maps the snapshot, compiling it first if it is missing or older than the text files.
+def load_graph(path=SNAPSHOT_PATH, city_file=CITY_FILE, road_file=ROAD_FILE):
+    if not is_snapshot_fresh(path, city_file, road_file):
+        compile_snapshot(path, city_file, road_file)
+    return RoadGraph(path)
+
+if __name__ == "__main__":
+    compile_snapshot()
+    graph = RoadGraph()
+    print("Snapshot with %d cities and %d roads written to %s" % (len(graph), len(graph.edge_targets) // 2,
+                                                                  SNAPSHOT_PATH))
@@ -8,36 +8,38 @@
 
 
 # !/usr/bin/env python3
+import os
 import sys
-from queue import PriorityQueue
+from array import array
 
-CITIES = {}
+import contraction
+import landmarks
+import pareto
+import road_graph
+import spatial_index
+import tree_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The engine get_route() answers with. It is created on the first call and then reused, so the map is loaded once
+# per process.
+ENGINE = None
 
-GOAL_CITY = ""
-MAX_SEGMENT_LENGTH = 0
-MAX_SPEED_HIGHWAY = 0
 ENABLE_HEURISTIC = False # if set to false, then h(s) = 0, which is also consistent.
+INFINITY = float("inf")
 
-class Segment:
-    def __init__(self, dest, length, speed, name):
-        self.dest = dest
-        self.city = dest.split(",")[0]
-        self.state = dest.split(",")[1]
-        self.length = float(length)
-        self.speed = float(speed)
-        self.name = name.strip()
-
-class City:
-    def __init__(self, city, lat, lng):
-        self.place = city
-        self.city = city.split(",")[0] # Stores only the city
-        self.state = city.split(",")[1] # Stores only the state
-        self.lat = None if not lat else float(lat)
-        self.lng = None if not lat else float(lng)
-        self.paths = []
-
-    def add_road(self, segment: Segment):
-        self.paths.append(segment)
+# "ch" answers queries on the contraction hierarchy of the cost function (see contraction.py), "alt" runs A* on the
+# road graph with the landmark heuristic (see landmarks.py), "astar" searches the road graph itself. Hierarchies are
+# built offline (python3 contraction.py); without an up to date one "ch" searches the road graph like "astar".
+ROUTE_ENGINE = os.environ.get("ROUTE_ENGINE", "ch")
+
+# Memory budget of the cache of shortest path trees (0 turns it off). A complete tree is grown for a (source, cost)
+# once it has been asked TREE_CACHE_AFTER times, and later queries from that source just walk its predecessors.
+TREE_CACHE_MB = float(os.environ.get("ROUTE_TREE_CACHE_MB", "64"))
+TREE_CACHE_AFTER = 2
 
 # Code start: Taken from https://janakiev.com/blog/gps-points-distance-python/ Shared by Hongxuan Zhai on QA community.
 from math import sin, cos, sqrt, atan2, radians
@@ -58,144 +60,436 @@ def distance_lat_lng(lat_lng1, lat_lng2):
     return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 # Code end: Taken from https://stackoverflow.com/questions/19412462/getting-distance-between-two-points-based-on-latitude-longitude
 
-class PriorityElem:
-    def __init__(self, current_state):
-        self.current_state = current_state
-
-    def __lt__(self, other):
-        if not ENABLE_HEURISTIC:
-            return self.current_state[0] < other.current_state[0]
-        return self.current_state[0] + self.current_state[1] < other.current_state[0] + other.current_state[1]
-
-def read_cities():
-    global CITIES
-    nodes = {}
-    with open("city-gps.txt") as file:
-        for line in file:
-            if not line:
-                continue
-            attribs = line.split(" ")
-            nodes[attribs[0]] = City(*attribs)
-    CITIES = nodes
-
-def read_roads():
-    global CITIES, MAX_SEGMENT_LENGTH, MAX_SPEED_HIGHWAY
-    with open("road-segments.txt") as file:
-        for line in file:
-            if not line:
+# Binary min heap of city ids with decrease-key. position[city] is the index of city in the heap (-1 when it is not
+# in it), so the fringe holds at most one entry per city and a cheaper path just moves that entry up.
+class IndexedHeap:
+    def __init__(self, size):
+        self.heap = []
+        self.keys = array("d", [INFINITY]) * size
+        self.position = array("i", [-1]) * size
+
+    def __len__(self):
+        return len(self.heap)
+
+    # Adds city with key, or lowers its key if it is already in the heap.
+    def push(self, city, key):
+        if self.position[city] == -1:
+            self.position[city] = len(self.heap)
+            self.heap.append(city)
+        elif key >= self.keys[city]:
+            return
+        self.keys[city] = key
+        self.sift_up(self.position[city])
+
+    # Removes and returns the city with the lowest key.
+    def pop(self):
+        heap = self.heap
+        city = heap[0]
+        last = heap.pop()
+        self.position[city] = -1
+        if heap:
+            heap[0] = last
+            self.position[last] = 0
+            self.sift_down(0)
+        return city
+
+    def sift_up(self, index):
+        (heap, keys, position) = (self.heap, self.keys, self.position)
+        city = heap[index]
+        key = keys[city]
+        while index > 0:
+            parent = (index - 1) >> 1
+            if keys[heap[parent]] <= key:
+                break
+            heap[index] = heap[parent]
+            position[heap[index]] = index
+            index = parent
+        heap[index] = city
+        position[city] = index
+
+    def sift_down(self, index):
+        (heap, keys, position) = (self.heap, self.keys, self.position)
+        city = heap[index]
+        key = keys[city]
+        size = len(heap)
+        while True:
+            child = 2 * index + 1
+            if child >= size:
+                break
+            if child + 1 < size and keys[heap[child + 1]] < keys[heap[child]]:
+                child += 1
+            if keys[heap[child]] >= key:
+                break
+            heap[index] = heap[child]
+            position[heap[index]] = index
+            index = child
+        heap[index] = city
+        position[city] = index
+
+# Dijkstra tree of the cheapest routes from source under one cost function. order lists the settled cities in the
+# order they were settled (source first), so every city comes after its predecessor. complete is False when the search
+# stopped as soon as some target cities were settled.
+class ShortestPathTree:
+    def __init__(self, source, cost, g_costs, previous_edges, previous_cities, order, complete):
+        self.source = source
+        self.cost = cost
+        self.g_costs = g_costs
+        self.previous_edges = previous_edges
+        self.previous_cities = previous_cities
+        self.order = order
+        self.complete = complete
+
+    def is_reached(self, city):
+        return self.g_costs[city] != INFINITY
+
+    # The roads of the route from source to city.
+    def get_path_edges(self, city):
+        edges = []
+        while self.previous_edges[city] != -1:
+            edges.append(self.previous_edges[city])
+            city = self.previous_cities[city]
+        edges.reverse()
+        return edges
+
+# Loads the road graph once and answers any number of route queries on it.
+# Cities are integer ids and roads are edge indices into the arrays of the graph (see road_graph.py). Names are only
+# looked up when the result is built.
+class RouteEngine:
+    def __init__(self, path=road_graph.SNAPSHOT_PATH, city_file=road_graph.CITY_FILE, road_file=road_graph.ROAD_FILE):
+        self.path = path
+        self.sources = [city_file, road_file]
+        self.tree_cache = tree_cache.TreeCache(int(TREE_CACHE_MB * 1024 * 1024))
+        self.graph = None
+        self.load()
+
+    # (Re)loads the graph. Everything derived from the previous one is dropped if the map itself changed.
+    def load(self):
+        self.source_stats = [self.get_source_stat(source) for source in self.sources]
+        graph = road_graph.load_graph(self.path, *self.sources)
+        if self.graph is not None and graph.fingerprint == self.graph.fingerprint:
+            return
+        self.graph = graph
+        self.spatial_index = spatial_index.SpatialIndex(graph)
+        self.goal_city = -1
+        self.goal_distances = []
+        self.hierarchies = {}
+        self.landmark_tables = {}
+        # The landmark table used by h_s() during an "alt" query.
+        self.landmark_table = None
+        self.tree_cache.clear()
+        self.tree_requests = {}
+
+    def get_source_stat(self, source):
+        stat = os.stat(source)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    # Reloads the graph if city-gps.txt or road-segments.txt changed since it was loaded.
+    def check_sources(self):
+        if [self.get_source_stat(source) for source in self.sources] != self.source_stats:
+            self.load()
+
+    # The cached complete tree of source under cost, or None. With admit, a tree is grown and cached once the same
+    # source and cost have been asked for TREE_CACHE_AFTER times.
+    def get_cached_tree(self, source, cost, admit=False):
+        key = (source, cost)
+        tree = self.tree_cache.get(key)
+        if tree is not None or not admit or self.tree_cache.budget == 0:
+            return tree
+        self.tree_requests[key] = self.tree_requests.get(key, 0) + 1
+        if self.tree_requests[key] < TREE_CACHE_AFTER:
+            return None
+        tree = self.get_shortest_path_tree(source, cost)
+        self.tree_cache.put(key, tree, len(self.graph))
+        return tree
+
+    # Hit and miss counters of the tree cache.
+    def get_cache_stats(self):
+        return self.tree_cache.get_stats()
+
+    # The contraction hierarchy of a cost function, mapped on first use. None if it hasn't been built for this
+    # snapshot, since building one inside a query would take seconds.
+    def get_hierarchy(self, cost):
+        if cost not in self.hierarchies:
+            self.hierarchies[cost] = contraction.open_hierarchy(self.graph, cost)
+        return self.hierarchies[cost]
+
+    # The landmark table of a cost function, loaded (or built) on first use.
+    def get_landmark_table(self, cost):
+        if cost not in self.landmark_tables:
+            self.landmark_tables[cost] = landmarks.load_landmarks(self.graph, cost)
+        return self.landmark_tables[cost]
+
+    # Loads what ROUTE_ENGINE needs for the cost functions up front. Called before forking worker processes, so they
+    # share the maps instead of each loading (or building) their own.
+    def preload(self, costs):
+        for cost in costs:
+            if ROUTE_ENGINE == "ch":
+                self.get_hierarchy(cost)
+            elif ROUTE_ENGINE == "alt":
+                self.get_landmark_table(cost)
+
+    # This function generates the output from the path segments that have been found.
+    def get_path_segments(self, edges):
+        graph = self.graph
+        route_taken = []
+        total_miles = 0
+        total_hours = 0
+        total_accidents = 0
+        for edge in edges:
+            length = graph.edge_lengths[edge]
+            highway = graph.highways[graph.edge_highways[edge]]
+            route_taken.append((graph.names[graph.edge_targets[edge]], highway + " for " + str(length) + " miles"))
+            total_miles += length
+            total_hours += graph.weight_time[edge]
+            total_accidents += graph.weight_safe[edge]
+
+        return {"total-segments": len(route_taken),
+                "total-miles": total_miles,
+                "total-hours": total_hours,
+                "total-expected-accidents": total_accidents,
+                "route-taken": route_taken}
+
+    # The roads of the route to city, followed back through the predecessor arrays.
+    def get_path_edges(self, previous_edges, previous_cities, city):
+        edges = []
+        while previous_edges[city] != -1:
+            edges.append(previous_edges[city])
+            city = previous_cities[city]
+        edges.reverse()
+        return edges
+
+    # The roads leaving a city, as edge indices.
+    def route_successor(self, city):
+        return range(self.graph.edge_offsets[city], self.graph.edge_offsets[city + 1])
+
+    def get_distance_in_cities(self, city1, city2):
+        graph = self.graph
+        return distance_lat_lng((graph.lat[city1], graph.lng[city1]), (graph.lat[city2], graph.lng[city2]))
+
+    # Great circle distance from goal to every city, computed once per query (with NumPy when it is installed). A
+    # city without GPS gets, from its neighbours that have GPS, the lowest of their distance minus the road length
+    # (1000000000 if there is none). If the goal itself has no GPS, every distance is 0.
+    def get_goal_distances(self, goal):
+        graph = self.graph
+        if not graph.has_gps(goal):
+            return [0] * len(graph)
+        if np is not None:
+            R = 3958.8
+            lat = np.radians(np.frombuffer(graph.lat, dtype=np.float64))
+            lng = np.radians(np.frombuffer(graph.lng, dtype=np.float64))
+            a = np.sin((lat[goal] - lat) / 2) ** 2 + \
+                np.cos(lat) * np.cos(lat[goal]) * np.sin((lng[goal] - lng) / 2) ** 2
+            distances = (2 * R * np.arctan2(np.sqrt(a), np.sqrt(1 - a))).tolist()
+        else:
+            distances = [self.get_distance_in_cities(city, goal) if graph.has_gps(city) else math.nan
+                         for city in range(len(graph))]
+
+        for city in range(len(graph)):
+            if graph.has_gps(city):
                 continue
-            attribs = line.split(" ")
-            if attribs[0] not in CITIES:
-                CITIES[attribs[0]] = City(attribs[0], "", "")
-            if attribs[1] not in CITIES:
-                CITIES[attribs[1]] = City(attribs[1], "", "")
-            CITIES[attribs[0]].add_road(Segment(*attribs[1:]))
-            CITIES[attribs[1]].add_road(Segment(*(attribs[:1] + attribs[2:])))
-            if float(attribs[2]) > MAX_SEGMENT_LENGTH:
-                MAX_SEGMENT_LENGTH = float(attribs[2])
-            if float(attribs[3]) > MAX_SPEED_HIGHWAY:
-                MAX_SPEED_HIGHWAY = float(attribs[3])
-
-def get_accident_on_road_segment(segment: Segment):
-    if segment.name[:2] == "I-":
-        return segment.length / 1000000
-    return segment.length * 2 / 1000000
-
-# This function generates the output from the path segments that have been found.
-def get_path_segments(segments):
-    route_taken = []
-    total_miles = 0
-    total_hours = 0
-    total_accidents = 0
-    for segment in segments:
-        route_taken.append((segment.dest, segment.name + " for " + str(segment.length) + " miles"))
-        total_miles += segment.length
-        total_hours += segment.length / segment.speed
-        total_accidents += get_accident_on_road_segment(segment)
-
-    return {"total-segments": len(route_taken),
-            "total-miles": total_miles,
-            "total-hours": total_hours,
-            "total-expected-accidents": total_accidents,
-            "route-taken": route_taken}
-
-def get_path_for_segment_state(state):
-    return get_path_segments(state[3])
-
-def route_successor(city):
-    return CITIES[city].paths
-
-def get_distance_in_cities(city1, city2):
-    return distance_lat_lng((CITIES[city1].lat, CITIES[city1].lng), (CITIES[city2].lat, CITIES[city2].lng))
-
-def get_distance_from_goal(city):
-    if not ENABLE_HEURISTIC:
-        return 0
-    if city == GOAL_CITY:
-        return 0
-    if CITIES[city].lat is not None or CITIES[city].lng is not None:
-        return distance_lat_lng((CITIES[city].lat, CITIES[city].lng), (CITIES[GOAL_CITY].lat, CITIES[GOAL_CITY].lng))
-    else:
-        min_goal_distance = 1000000000
-        for segment in CITIES[city].paths:
-            if CITIES[segment.dest].lat is None or CITIES[segment.dest].lng is None:
+            min_goal_distance = 1000000000
+            for edge in self.route_successor(city):
+                if not graph.has_gps(graph.edge_targets[edge]):
+                    continue
+                consistency_distance = distances[graph.edge_targets[edge]] - graph.edge_lengths[edge]
+                if consistency_distance < min_goal_distance:
+                    min_goal_distance = consistency_distance
+            distances[city] = min_goal_distance
+        distances[goal] = 0
+        return distances
+
+    def get_distance_from_goal(self, city):
+        if not ENABLE_HEURISTIC:
+            return 0
+        return self.goal_distances[city]
+
+    def h_segment(self, city):
+        goal_distance = self.get_distance_from_goal(city)
+        return goal_distance / self.graph.max_length
+
+    def h_time(self, city):
+        goal_distance = self.get_distance_from_goal(city)
+        return goal_distance / self.graph.max_speed
+
+    def h_safe(self, city):
+        goal_distance = self.get_distance_from_goal(city)
+        return goal_distance/1000000
+
+    # Calculates the lat lng distance and tries to estimate the cost.
+    # With the "alt" engine the landmark lower bound is used instead.
+    def h_s(self, city, type):
+        if self.landmark_table is not None:
+            return self.landmark_table.get_lower_bound(city)
+        if not ENABLE_HEURISTIC:
+            return 0
+        if type == "segments":
+            return self.h_segment(city)
+        if type == "distance":
+            return self.get_distance_from_goal(city)
+        if type == "time":
+            return self.h_time(city)
+        if type == "safe":
+            return self.h_safe(city)
+
+    # Relaxes the road edge out of city. g_costs, heuristics, previous_edges and previous_cities are indexed by city;
+    # heuristics holds -1 until h(s) of a city is first needed. weights are the edge weights of the cost function
+    # type, precomputed in the graph.
+    def insert_in_fringe(self, fringe, edge, city, type, g_costs, heuristics, previous_edges, previous_cities, weights):
+        dest = self.graph.edge_targets[edge]
+        g_s = g_costs[city] + weights[edge]
+        if g_s >= g_costs[dest]:
+            return
+        if heuristics[dest] == -1:
+            heuristics[dest] = self.h_s(dest, type)
+        g_costs[dest] = g_s
+        previous_edges[dest] = edge
+        previous_cities[dest] = city
+        fringe.push(dest, g_s + heuristics[dest])
+
+        # INCONSISTENCY DETECTION CODE.
+        # if (heuristics[city] - weights[edge]) > heuristics[dest]:
+        #     print("Consistency check failed for: " + self.graph.names[city] + " for segment: " + self.graph.names[dest] + " path name: " + self.graph.highways[self.graph.edge_highways[edge]])
+        #     print("previous h(s): " + str(heuristics[city]) + " edge weight: " + str(weights[edge]) + " current h: " + str(heuristics[dest]))
+        #     print(self.get_distance_from_goal(city))
+        #     print(self.get_distance_from_goal(dest))
+
+    # Plain Dijkstra from the city id source. With targets (a set of city ids) the search stops once they are all
+    # settled, else it covers every city that can be reached.
+    def get_shortest_path_tree(self, source, cost, targets=None):
+        graph = self.graph
+        weights = graph.get_weights(cost)
+        g_costs = array("d", [INFINITY]) * len(graph)
+        heuristics = array("d", [0]) * len(graph)
+        previous_edges = array("i", [-1]) * len(graph)
+        previous_cities = array("i", [-1]) * len(graph)
+        closed_cities = bytearray(len(graph))
+        order = array("I")
+        left = len(targets) if targets is not None else -1
+
+        fringe = IndexedHeap(len(graph))
+        g_costs[source] = 0
+        fringe.push(source, 0)
+        while fringe and left != 0:
+            city = fringe.pop()
+            closed_cities[city] = 1
+            order.append(city)
+            if targets is not None and city in targets:
+                left -= 1
+            for edge in self.route_successor(city):
+                if closed_cities[graph.edge_targets[edge]]:
+                    continue
+                self.insert_in_fringe(fringe, edge, city, cost, g_costs, heuristics, previous_edges, previous_cities,
+                                      weights)
+        return ShortestPathTree(source, cost, g_costs, previous_edges, previous_cities, order, not fringe)
+
+    # Same result as get_route(), for city names start and end.
+    def route(self, start, end, cost):
+        self.check_sources()
+        graph = self.graph
+        if start not in graph.ids:
+            raise(Exception("Error: unknown city " + start))
+        if end not in graph.ids:
+            raise(Exception("Error: unknown city " + end))
+        weights = graph.get_weights(cost)
+        start = graph.ids[start]
+        end = graph.ids[end]
+        tree = self.get_cached_tree(start, cost, admit=True)
+        if tree is not None:
+            return self.get_path_segments(tree.get_path_edges(end) if tree.is_reached(end) else [])
+        hierarchy = self.get_hierarchy(cost) if ROUTE_ENGINE == "ch" else None
+        if hierarchy is not None:
+            return self.get_path_segments(hierarchy.query(start, end)[1])
+        self.goal_city = end
+        if ENABLE_HEURISTIC:
+            self.goal_distances = self.get_goal_distances(end)
+        self.landmark_table = None
+        if ROUTE_ENGINE == "alt":
+            self.landmark_table = self.get_landmark_table(cost)
+            if not self.landmark_table.is_reachable(start, end):
+                return self.get_path_segments([])
+            self.landmark_table.set_goal(end)
+
+        g_costs = array("d", [INFINITY]) * len(graph)
+        heuristics = array("d", [-1]) * len(graph)
+        previous_edges = array("i", [-1]) * len(graph)
+        previous_cities = array("i", [-1]) * len(graph)
+        closed_cities = bytearray(len(graph))
+
+        fringe = IndexedHeap(len(graph))
+        g_costs[start] = 0
+        heuristics[start] = self.h_s(start, cost)
+        fringe.push(start, heuristics[start])
+
+        while fringe:
+            city = fringe.pop()
+            closed_cities[city] = 1
+
+            if city == end:
+                return self.get_path_segments(self.get_path_edges(previous_edges, previous_cities, city))
+            for edge in self.route_successor(city):
+                if closed_cities[graph.edge_targets[edge]]:
+                    continue
+                self.insert_in_fringe(fringe, edge, city, cost, g_costs, heuristics, previous_edges, previous_cities,
+                                      weights)
+
+        return self.get_path_segments([])
+
+    # All routes from start to end that are Pareto optimal over miles, hours and expected accidents, found in one
+    # search (see pareto.py). Returns {"distance": ..., "time": ..., "safe": ..., "pareto-front": [...]}, the first
+    # three being the cheapest route for that cost function, each route in the get_route() format.
+    def route_pareto(self, start, end):
+        self.check_sources()
+        graph = self.graph
+        for city in (start, end):
+            if city not in graph.ids:
+                raise(Exception("Error: unknown city " + city))
+        # Roads are two way, so the trees grown from end give the exact cost of each criterion to end.
+        trees = [self.get_cached_tree(graph.ids[end], cost) or self.get_shortest_path_tree(graph.ids[end], cost)
+                 for cost in ("distance", "time", "safe")]
+        bounds = [tree.g_costs for tree in trees]
+        routes = pareto.find_pareto_routes(graph, graph.ids[start], graph.ids[end], bounds)
+
+        result = {"pareto-front": [self.get_path_segments(route[3]) for route in routes]}
+        for (cost, criterion) in (("distance", 0), ("time", 1), ("safe", 2)):
+            if not routes:
+                result[cost] = self.get_path_segments([])
                 continue
-            consistency_distance = get_distance_from_goal(segment.dest) - segment.length
-            if consistency_distance < min_goal_distance:
-                min_goal_distance = consistency_distance
-        return min_goal_distance
-
-def h_segment(city):
-    goal_distance = get_distance_from_goal(city)
-    return goal_distance / MAX_SEGMENT_LENGTH
-
-def h_time(city):
-    goal_distance = get_distance_from_goal(city)
-    return goal_distance / MAX_SPEED_HIGHWAY
-
-def h_safe(city):
-    goal_distance = get_distance_from_goal(city)
-    return goal_distance/1000000
-
-# Calculates the lat lng distance and tries to estimate the cost.
-def h_s(city, type):
-    if not ENABLE_HEURISTIC:
-        return 0
-    if type == "segments":
-        return h_segment(city)
-    if type == "distance":
-        return get_distance_from_goal(city)
-    if type == "time":
-        return h_time(city)
-    if type == "safe":
-        return h_safe(city)
-
-def insert_in_fringe(fringe, segment, previous_elem: PriorityElem, type, fringe_cities):
-    f_s = previous_elem.current_state[0]
-    path = previous_elem.current_state[3] + [segment]
-    heuristic_val = h_s(segment.dest, type)
-    edge_weight = 0
-    if type == "segments":
-        edge_weight = 1
-    if type == "distance":
-        edge_weight = segment.length
-    if type == "time":
-        edge_weight = segment.length/segment.speed
-    if type == "safe":
-        edge_weight = get_accident_on_road_segment(segment)
-
-    if segment.dest in fringe_cities and fringe_cities[segment.dest] < (f_s + edge_weight + heuristic_val):
-        return
-    fringe.put(PriorityElem((f_s + edge_weight, heuristic_val, segment.dest, path)))
-    fringe_cities[segment.dest] = f_s + edge_weight + heuristic_val
-
-    # INCONSISTENCY DETECTION CODE.
-    # if (previous_elem.current_state[1] - edge_weight) > heuristic_val:
-    #     print("Consistency check failed for: " + previous_elem.current_state[2] + " for segment: " + segment.dest + " path name: " + segment.name)
-    #     print("previous h(s): " + str(previous_elem.current_state[1]) + " edge weight: " + str(edge_weight) + " current h: " + str(heuristic_val))
-    #     print(get_distance_from_goal(previous_elem.current_state[2]))
-    #     print(get_distance_from_goal(segment.dest))
-    return (f_s + edge_weight, heuristic_val)
+            best = min(routes, key=lambda route: (route[criterion], route[:3]))
+            result[cost] = self.get_path_segments(best[3])
+        return result
+
+    # The k cities closest to (lat, lng), as (city name, miles) pairs sorted by distance.
+    def get_nearest_cities(self, lat, lng, k=1):
+        self.check_sources()
+        return [(self.graph.names[city], miles) for (miles, city) in self.spatial_index.get_nearest(lat, lng, k)]
+
+    # Every city within radius miles of (lat, lng), as (city name, miles) pairs sorted by distance.
+    def get_cities_within(self, lat, lng, radius):
+        self.check_sources()
+        return [(self.graph.names[city], miles) for (miles, city) in self.spatial_index.get_within(lat, lng, radius)]
+
+    # Route between two points given by their coordinates. Each point is snapped to the closest city that has roads.
+    # Returns the get_route() result plus "start-city" and "end-city".
+    def route_coordinates(self, start_lat, start_lng, end_lat, end_lng, cost):
+        self.check_sources()
+        graph = self.graph
+        has_roads = lambda city: graph.edge_offsets[city] < graph.edge_offsets[city + 1]
+        cities = []
+        for (lat, lng) in ((start_lat, start_lng), (end_lat, end_lng)):
+            nearest = self.spatial_index.get_nearest(lat, lng, 1, has_roads)
+            if not nearest:
+                raise(Exception("Error: no city near %f, %f" % (lat, lng)))
+            cities.append(graph.names[nearest[0][1]])
+        result = self.route(cities[0], cities[1], cost)
+        result["start-city"] = cities[0]
+        result["end-city"] = cities[1]
+        return result
+
+def get_engine():
+    global ENGINE
+    if ENGINE is None:
+        ENGINE = RouteEngine()
+    return ENGINE
 
 def get_route(start, end, cost):
 
@@ -217,33 +511,7 @@ def get_route(start, end, cost):
     4. You can assume that all test cases will be solvable.
     5. The current code just returns a dummy solution.
     """
-    read_cities()
-    read_roads()
-
-    global GOAL_CITY
-    GOAL_CITY = end
-
-    fringe = PriorityQueue()
-    fringe.put(PriorityElem((0, h_s(start, cost), start, [])))
-
-    closed_cities = set()
-    cities_in_fringe = {}
-
-    while not fringe.empty():
-        elem = fringe.get()
-        closed_cities.add(elem.current_state[2])
-        if elem.current_state[2] in cities_in_fringe:
-            del cities_in_fringe[elem.current_state[2]]
-
-        if elem.current_state[2] == end:
-            return get_path_for_segment_state(elem.current_state)
-        prev_hs = elem.current_state[1]
-        for segment in route_successor(elem.current_state[2]):
-            if segment.dest in closed_cities:
-                continue
-            insert_in_fringe(fringe, segment, elem, cost, cities_in_fringe)
-
-    return get_path_segments([])
+    return get_engine().route(start, end, cost)
 
 # Please don't modify anything below this line
 #
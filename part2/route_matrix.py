@@ -0,0 +1,102 @@
+#!/usr/local/bin/python3
+# route_matrix.py : Travel cost matrices between many cities
+#
+# One Dijkstra tree is grown per origin (stopping once every destination is settled), instead of one search per
+# pair. Along the cheapest route under the chosen cost function, the miles, hours, segments and expected accidents
+# are summed for every city of the tree in the order the cities were settled. Each sum is one pass over the tree,
+# since a city always comes after its predecessor.
+#
+# The result has one matrix per measure, with a row per origin and a column per destination. The matrices are NumPy
+# arrays when NumPy is installed and lists of array("d") rows otherwise. Unreachable pairs are inf. With workers > 1
+# the origins are spread over a forked process pool that shares the road graph loaded by the parent.
+#
+# Usage: python3 route_matrix.py [cities.txt] [--cost distance|time|segments|safe] [--workers N]
+#   prints {"cities": [...], "miles": [[...], ...], "hours": ..., "segments": ..., "accidents": ...}
+#
+
+import argparse
+import json
+import math
+import multiprocessing
+import sys
+from array import array
+
+import road_graph
+import route
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MEASURES = ("miles", "hours", "segments", "accidents")
+
+# Per city totals of every measure along the routes of tree, inf for cities the tree didn't settle.
+def get_tree_totals(graph, tree):
+    edge_weights = (graph.edge_lengths, graph.weight_time, graph.weight_segments, graph.weight_safe)
+    totals = [array("d", [route.INFINITY]) * len(graph) for _ in MEASURES]
+    for total in totals:
+        total[tree.source] = 0
+    for city in tree.order[1:]:
+        (edge, previous) = (tree.previous_edges[city], tree.previous_cities[city])
+        for i in range(len(MEASURES)):
+            totals[i][city] = totals[i][previous] + edge_weights[i][edge]
+    return totals
+
+# One row of every matrix: the totals from origin to each destination (city ids). A cached tree is used if there is
+# one, without counting as a hit or miss of the route queries.
+def get_matrix_rows(job):
+    (origin, destinations, cost) = job
+    engine = route.get_engine()
+    tree = engine.tree_cache.peek((origin, cost)) or engine.get_shortest_path_tree(origin, cost, set(destinations))
+    totals = get_tree_totals(engine.graph, tree)
+    return [array("d", [total[city] for city in destinations]) for total in totals]
+
+# Returns {measure: matrix} for routes from every origin to every destination (city names; destinations default to
+# the origins), each route being the cheapest under cost.
+def get_cost_matrices(origins, destinations=None, cost="distance", workers=1):
+    engine = route.get_engine()
+    engine.check_sources()
+    if cost not in road_graph.COSTS:
+        raise(Exception("Error: invalid cost function"))
+    destinations = origins if destinations is None else destinations
+    for city in list(origins) + list(destinations):
+        if city not in engine.graph.ids:
+            raise(Exception("Error: unknown city " + city))
+    targets = [engine.graph.ids[city] for city in destinations]
+    jobs = [(engine.graph.ids[city], targets, cost) for city in origins]
+
+    if workers is None or workers <= 1:
+        rows = [get_matrix_rows(job) for job in jobs]
+    else:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        with context.Pool(workers) as pool:
+            rows = pool.map(get_matrix_rows, jobs)
+
+    matrices = {}
+    for (i, measure) in enumerate(MEASURES):
+        matrix = [row[i] for row in rows]
+        matrices[measure] = np.array(matrix, dtype=np.float64).reshape(len(origins), len(destinations)) \
+            if np is not None else matrix
+    return matrices
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the travel cost matrices between a list of cities.")
+    parser.add_argument("cities", nargs="?", default="-", help="file with one city per line, or - for stdin")
+    parser.add_argument("--cost", choices=road_graph.COSTS, default="distance")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (default: run in this process)")
+    args = parser.parse_args()
+
+    if args.cities == "-":
+        cities = sys.stdin.read().split()
+    else:
+        with open(args.cities, "r") as file:
+            cities = file.read().split()
+    matrices = get_cost_matrices(cities, cost=args.cost, workers=args.workers)
+
+    result = {"cities": cities}
+    for measure in MEASURES:
+        # JSON has no infinity, so unreachable pairs are null.
+        result[measure] = [[None if math.isinf(value) else value for value in row] for row in matrices[measure]]
+    print(json.dumps(result))
@@ -0,0 +1,132 @@
+#!/usr/local/bin/python3
+# spatial_index.py : Grid index over the coordinates of the cities
+#
+# The cities with GPS are bucketed into square cells of GRID_DEGREES of latitude and longitude, stored in the road
+# graph snapshot as CSR arrays: the cities of cell (row, col) are grid_cities[grid_offsets[i] .. grid_offsets[i + 1]]
+# with i = row * cols + col. grid_info holds (min lat, min lng, cell size, rows, cols).
+#
+# Nearest neighbour queries scan rings of cells around the cell of the query point, and stop once the next ring is
+# farther than the k-th best city found so far. Radius queries only scan the cells of the bounding box.
+#
+
+import heapq
+import math
+from array import array
+
+GRID_DEGREES = 0.5
+R = 3958.8
+# Miles per degree of latitude.
+MILES_PER_DEGREE = 2 * math.pi * R / 360
+
+# Same great circle distance as distance_lat_lng() in route.py.
+def get_distance(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+# Returns the grid_info, grid_offsets and grid_cities sections for cities at lat/lng (NaN when unknown).
+def build_grid(lat, lng, cell=GRID_DEGREES):
+    cities = [city for city in range(len(lat)) if not math.isnan(lat[city])]
+    if not cities:
+        return (array("d", [0, 0, cell, 0, 0]), array("I", [0]), array("I"))
+    min_lat = min(lat[city] for city in cities)
+    min_lng = min(lng[city] for city in cities)
+    rows = int((max(lat[city] for city in cities) - min_lat) / cell) + 1
+    cols = int((max(lng[city] for city in cities) - min_lng) / cell) + 1
+
+    cells = [[] for _ in range(rows * cols)]
+    for city in cities:
+        cells[int((lat[city] - min_lat) / cell) * cols + int((lng[city] - min_lng) / cell)].append(city)
+    offsets = array("I", [0])
+    members = array("I")
+    for cell_cities in cells:
+        members.extend(cell_cities)
+        offsets.append(len(members))
+    return (array("d", [min_lat, min_lng, cell, rows, cols]), offsets, members)
+
+class SpatialIndex:
+    def __init__(self, graph):
+        self.graph = graph
+        (self.min_lat, self.min_lng, self.cell, rows, cols) = graph.grid_info
+        (self.rows, self.cols) = (int(rows), int(cols))
+        self.top = max(abs(self.min_lat), abs(self.min_lat + self.rows * self.cell))
+
+    # Lower bound on the distance from a point at latitude lat to any city ring cells or more away from its cell. Such
+    # a city is (ring - 1) cells away in latitude or in longitude. With haversine, a longitude difference d between
+    # points no farther from the equator than top is at least 2R asin(cos(top) sin(d / 2)) miles.
+    def get_ring_distance(self, lat, ring):
+        degrees = math.radians(max(ring - 1, 0) * self.cell)
+        top = math.radians(min(max(self.top, abs(lat)), 90.0))
+        return min(R * degrees, 2 * R * math.asin(math.cos(top) * math.sin(min(degrees, math.pi) / 2)))
+
+    # Cell (row, col) of a point, clamped to the grid.
+    def get_cell(self, lat, lng):
+        row = min(max(int((lat - self.min_lat) // self.cell), 0), self.rows - 1)
+        col = min(max(int((lng - self.min_lng) // self.cell), 0), self.cols - 1)
+        return (row, col)
+
+    def get_cell_cities(self, row, col):
+        i = row * self.cols + col
+        return self.graph.grid_cities[self.graph.grid_offsets[i]:self.graph.grid_offsets[i + 1]]
+
+    # Cells at Chebyshev distance ring from (row, col) that are inside the grid.
+    def get_ring(self, row, col, ring):
+        if ring == 0:
+            return [(row, col)]
+        cells = []
+        for r in range(row - ring, row + ring + 1):
+            if r < 0 or r >= self.rows:
+                continue
+            step = 1 if r in (row - ring, row + ring) else 2 * ring
+            for c in range(col - ring, col + ring + 1, step):
+                if 0 <= c < self.cols:
+                    cells.append((r, c))
+        return cells
+
+    # The k cities closest to (lat, lng), as (miles, city) pairs sorted by distance. accept(city) can leave cities
+    # out, e.g. the ones without roads.
+    def get_nearest(self, lat, lng, k=1, accept=None):
+        if self.rows == 0:
+            return []
+        (row, col) = self.get_cell(lat, lng)
+        # Max heap (negated distances) of the k best cities so far.
+        best = []
+        ring = 0
+        while ring <= max(self.rows, self.cols):
+            if len(best) == k and self.get_ring_distance(lat, ring) > -best[0][0]:
+                break
+            for (r, c) in self.get_ring(row, col, ring):
+                for city in self.get_cell_cities(r, c):
+                    if accept is not None and not accept(city):
+                        continue
+                    distance = get_distance(lat, lng, self.graph.lat[city], self.graph.lng[city])
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, city))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, city))
+            ring += 1
+        return sorted((-distance, city) for (distance, city) in best)
+
+    # Every city within radius miles of (lat, lng), as (miles, city) pairs sorted by distance.
+    def get_within(self, lat, lng, radius):
+        if self.rows == 0:
+            return []
+        # Inverse of the bound of get_ring_distance(): the cities within radius are inside this box.
+        lat_degrees = radius / MILES_PER_DEGREE
+        top = math.radians(min(max(abs(lat - lat_degrees), abs(lat + lat_degrees)), 90.0))
+        ratio = math.sin(min(radius / R, math.pi) / 2) / max(math.cos(top), 1e-9)
+        lng_degrees = 180.0 if ratio >= 1 else math.degrees(2 * math.asin(ratio))
+        (low_row, low_col) = self.get_cell(lat - lat_degrees, lng - lng_degrees)
+        (high_row, high_col) = self.get_cell(lat + lat_degrees, lng + lng_degrees)
+
+        found = []
+        for r in range(low_row, high_row + 1):
+            for c in range(low_col, high_col + 1):
+                for city in self.get_cell_cities(r, c):
+                    distance = get_distance(lat, lng, self.graph.lat[city], self.graph.lng[city])
+                    if distance <= radius:
+                        found.append((distance, city))
+        found.sort()
+        return found
@@ -0,0 +1,260 @@
+# !/usr/bin/env python3
+# test_routing.py : Tests of the route engines and the tools built on the road graph
+#
+# Dijkstra trees from RouteEngine.get_shortest_path_tree() are the reference the faster engines are checked against.
+
+import io
+import json
+import os
+import shutil
+import random
+import subprocess
+import sys
+
+import pytest
+
+import batch_route
+import contraction
+import road_graph
+import route
+import route_matrix
+import spatial_index
+
+PAIR_COUNT = 25
+
+# route() total that each cost function minimises.
+TOTALS = {"segments": "total-segments", "distance": "total-miles", "time": "total-hours",
+          "safe": "total-expected-accidents"}
+
+PARETO_PAIRS = [("Bloomington,_Indiana", "Indianapolis,_Indiana"),
+                ("Bloomington,_Indiana", "Chicago,_Illinois"),
+                ("Columbus,_Ohio", "Louisville,_Kentucky")]
+
+# route_matrix measure that each cost function minimises.
+MEASURES = {"segments": "segments", "distance": "miles", "time": "hours", "safe": "accidents"}
+
+MATRIX_CITIES = ["Bloomington,_Indiana", "Indianapolis,_Indiana", "Chicago,_Illinois", "Columbus,_Ohio",
+                 "Louisville,_Kentucky"]
+
+BATCH_QUERIES = "Bloomington,_Indiana Indianapolis,_Indiana distance\n" \
+                "Columbus,_Ohio Louisville,_Kentucky time\n" \
+                "\n" \
+                "Bloomington,_Indiana Nowhere,_Utopia safe\n" \
+                "Bloomington,_Indiana Chicago,_Illinois segments\n"
+
+@pytest.fixture(scope="module")
+def engine():
+    # The tree cache would answer repeated sources from Dijkstra trees, hiding the engine under test.
+    cache_mb = route.TREE_CACHE_MB
+    route.TREE_CACHE_MB = 0
+    yield route.RouteEngine()
+    route.TREE_CACHE_MB = cache_mb
+
+@pytest.fixture(scope="module")
+def pairs(engine):
+    rng = random.Random(2021)
+    has_roads = lambda city: engine.graph.edge_offsets[city] < engine.graph.edge_offsets[city + 1]
+    cities = [city for city in range(len(engine.graph)) if has_roads(city)]
+    return [(rng.choice(cities), rng.choice(cities)) for _ in range(PAIR_COUNT)]
+
+def get_dijkstra_costs(engine, pairs, cost):
+    return [engine.get_shortest_path_tree(source, cost, {target}).g_costs[target] for (source, target) in pairs]
+
+# Cost of a route given as roads, under cost.
+def get_edges_cost(engine, edges, cost):
+    weights = engine.graph.get_weights(cost)
+    return sum([weights[edge] for edge in edges])
+
+# The heap pops the lowest key, and a push of a city already in the heap only ever lowers its key.
+def test_indexed_heap():
+    rng = random.Random(20)
+    heap = route.IndexedHeap(50)
+    reference = {}
+    for _ in range(3000):
+        if reference and rng.random() < 0.3:
+            lowest = min(reference.values())
+            assert reference.pop(heap.pop()) == lowest
+        else:
+            (city, key) = (rng.randrange(50), rng.randrange(100))
+            heap.push(city, key)
+            reference[city] = min(reference.get(city, key), key)
+        assert len(heap) == len(reference)
+        assert all([heap.heap[heap.position[city]] == city for city in reference])
+        assert all([heap.keys[city] == key for (city, key) in reference.items()])
+
+# Every cell must hold the cost of the route() answer for its pair, and a pool must give the same matrices.
+@pytest.mark.parametrize("cost", road_graph.COSTS)
+def test_cost_matrices_match_route(cost):
+    matrices = route_matrix.get_cost_matrices(MATRIX_CITIES, MATRIX_CITIES[1:], cost)
+    for (i, start) in enumerate(MATRIX_CITIES):
+        for (j, end) in enumerate(MATRIX_CITIES[1:]):
+            expected = route.get_engine().route(start, end, cost)
+            assert matrices[MEASURES[cost]][i][j] == pytest.approx(expected[TOTALS[cost]])
+            if start == end:
+                assert all([matrices[measure][i][j] == 0 for measure in route_matrix.MEASURES])
+    pooled = route_matrix.get_cost_matrices(MATRIX_CITIES, MATRIX_CITIES[1:], cost, workers=2)
+    for measure in route_matrix.MEASURES:
+        assert [list(row) for row in pooled[measure]] == [list(row) for row in matrices[measure]]
+
+# Batch answers must be those of route(), in query order without a pool, and with errors reported per query.
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batch_route_matches_route(workers):
+    queries = batch_route.read_queries(io.StringIO(BATCH_QUERIES))
+    assert len(queries) == 4
+    results = list(batch_route.answer_queries(queries, workers))
+    if workers == 1:
+        assert [result["index"] for result in results] == [0, 1, 2, 3]
+    results.sort(key=lambda result: result["index"])
+    for ((start, end, cost), result) in zip(queries, results):
+        assert (result["start"], result["end"], result["cost"]) == (start, end, cost)
+        if end == "Nowhere,_Utopia":
+            assert "unknown city" in result["error"]
+            continue
+        expected = route.get_engine().route(start, end, cost)
+        assert result["route-taken"] == expected["route-taken"]
+        assert result["total-miles"] == pytest.approx(expected["total-miles"])
+    for text in ["Bloomington,_Indiana Chicago,_Illinois", "Bloomington,_Indiana Chicago,_Illinois scenic"]:
+        with pytest.raises(Exception):
+            batch_route.read_queries(io.StringIO(text))
+
+def test_batch_route_command_line():
+    output = subprocess.run([sys.executable, "batch_route.py"], input=BATCH_QUERIES, capture_output=True, text=True,
+                            check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    results = [json.loads(line) for line in output.splitlines()]
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert "error" in results[2] and results[0]["total-segments"] > 0
+
+@pytest.mark.parametrize("cost", road_graph.COSTS)
+def test_hierarchy_matches_dijkstra(engine, pairs, cost):
+    hierarchy = contraction.load_hierarchy(engine.graph, cost)
+    for ((source, target), expected) in zip(pairs, get_dijkstra_costs(engine, pairs, cost)):
+        (found, edges) = hierarchy.query(source, target)
+        if expected == route.INFINITY:
+            assert found is None
+            continue
+        assert found == pytest.approx(expected)
+        assert get_edges_cost(engine, edges, cost) == pytest.approx(expected)
+        # The unpacked roads must form a route from source to target.
+        city = source
+        for edge in edges:
+            assert engine.graph.edge_offsets[city] <= edge < engine.graph.edge_offsets[city + 1]
+            city = engine.graph.edge_targets[edge]
+        assert city == target
+
+@pytest.mark.parametrize("cost", road_graph.COSTS)
+def test_alt_matches_dijkstra(engine, pairs, cost, monkeypatch):
+    monkeypatch.setattr(route, "ROUTE_ENGINE", "alt")
+    names = engine.graph.names
+    for ((source, target), expected) in zip(pairs, get_dijkstra_costs(engine, pairs, cost)):
+        result = engine.route(names[source], names[target], cost)
+        if expected == route.INFINITY:
+            assert result["total-segments"] == 0
+            continue
+        assert result[TOTALS[cost]] == pytest.approx(expected)
+
+# A source asked for TREE_CACHE_AFTER times gets its tree cached, and later queries from it are hits with the same
+# answers. Matrices may use the tree without being counted, and a changed map drops it.
+def test_tree_cache_hits_and_invalidation(tmp_path, monkeypatch):
+    for source in [road_graph.CITY_FILE, road_graph.ROAD_FILE]:
+        shutil.copy(source, str(tmp_path / os.path.basename(source)))
+    (city_file, road_file) = [str(tmp_path / os.path.basename(source)) for source in [road_graph.CITY_FILE,
+                                                                                      road_graph.ROAD_FILE]]
+    monkeypatch.setattr(route, "TREE_CACHE_MB", 64)
+    engine = route.RouteEngine(str(tmp_path / "road-graph.bin"), city_file, road_file)
+    (start, end) = ("Bloomington,_Indiana", "Chicago,_Illinois")
+    expected = engine.route(start, end, "time")
+    for _ in range(route.TREE_CACHE_AFTER - 1):
+        assert engine.route(start, "Indianapolis,_Indiana", "time")["total-segments"] > 0
+    assert len(engine.tree_cache) == 1
+    hits = engine.get_cache_stats()["hits"]
+    assert engine.route(start, end, "time") == expected
+    assert engine.get_cache_stats()["hits"] == hits + 1
+
+    monkeypatch.setattr(route, "ENGINE", engine)
+    stats = engine.get_cache_stats()
+    matrices = route_matrix.get_cost_matrices([start], [end], "time")
+    assert matrices["hours"][0][0] == pytest.approx(expected["total-hours"])
+    assert engine.get_cache_stats() == stats
+
+    with open(road_file, "a") as file:
+        file.write(start + " " + end + " 1 60 Test_Road\n")
+    # Size differs, so the change is seen whatever the mtime resolution.
+    result = engine.route(start, end, "time")
+    assert len(engine.tree_cache) == 0
+    assert (result["total-segments"], result["total-miles"]) == (1, 1)
+
+# The recursive per city lookup that get_goal_distances() replaced.
+def get_distance_from_goal(engine, goal, city):
+    graph = engine.graph
+    if city == goal:
+        return 0
+    if graph.has_gps(city):
+        return engine.get_distance_in_cities(city, goal)
+    min_goal_distance = 1000000000
+    for edge in engine.route_successor(city):
+        if not graph.has_gps(graph.edge_targets[edge]):
+            continue
+        consistency_distance = get_distance_from_goal(engine, goal, graph.edge_targets[edge]) - \
+            graph.edge_lengths[edge]
+        if consistency_distance < min_goal_distance:
+            min_goal_distance = consistency_distance
+    return min_goal_distance
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_goal_distances_match_recursion(engine, pairs, use_numpy, monkeypatch):
+    if use_numpy and route.np is None:
+        pytest.skip("NumPy is not installed")
+    if not use_numpy:
+        monkeypatch.setattr(route, "np", None)
+    graph = engine.graph
+    for goal in [target for (_, target) in pairs[:5] if graph.has_gps(target)]:
+        distances = engine.get_goal_distances(goal)
+        expected = [get_distance_from_goal(engine, goal, city) for city in range(len(graph))]
+        assert distances == pytest.approx(expected)
+
+# The front must hold the route() optimum of each criterion, and so must the per criterion answers.
+@pytest.mark.parametrize("start, end", PARETO_PAIRS)
+def test_pareto_optima_match_route(engine, start, end, monkeypatch):
+    monkeypatch.setattr(route, "ROUTE_ENGINE", "astar")
+    result = engine.route_pareto(start, end)
+    assert result["pareto-front"]
+    for cost in ("distance", "time", "safe"):
+        expected = engine.route(start, end, cost)[TOTALS[cost]]
+        assert result[cost][TOTALS[cost]] == pytest.approx(expected)
+        assert min([front[TOTALS[cost]] for front in result["pareto-front"]]) == pytest.approx(expected)
+    # No route of the front may be at least as good as another one on all three criteria.
+    points = [tuple([front[TOTALS[cost]] for cost in ("distance", "time", "safe")]) for front in result["pareto-front"]]
+    for (i, point) in enumerate(points):
+        for other in points[i + 1:]:
+            assert not all([a <= b for (a, b) in zip(point, other)])
+            assert not all([b <= a for (a, b) in zip(point, other)])
+
+# Query points around the map, and a few far outside it.
+def get_query_points(engine):
+    graph = engine.graph
+    rng = random.Random(7)
+    gps = [city for city in range(len(graph)) if graph.has_gps(city)]
+    points = []
+    for _ in range(40):
+        city = rng.choice(gps)
+        points.append((graph.lat[city] + rng.uniform(-2, 2), graph.lng[city] + rng.uniform(-2, 2)))
+    return points + [(0.0, 0.0), (80.0, -170.0), (-45.0, 100.0)]
+
+def get_all_distances(engine, lat, lng):
+    graph = engine.graph
+    return sorted((spatial_index.get_distance(lat, lng, graph.lat[city], graph.lng[city]), city)
+                  for city in range(len(graph)) if graph.has_gps(city))
+
+@pytest.mark.parametrize("k", [1, 5, 20])
+def test_nearest_matches_brute_force(engine, k):
+    for (lat, lng) in get_query_points(engine):
+        expected = get_all_distances(engine, lat, lng)[:k]
+        found = engine.spatial_index.get_nearest(lat, lng, k)
+        # Ties may come in another order, so the distances are compared.
+        assert [miles for (miles, _) in found] == pytest.approx([miles for (miles, _) in expected])
+
+@pytest.mark.parametrize("radius", [5, 50, 300])
+def test_within_matches_brute_force(engine, radius):
+    for (lat, lng) in get_query_points(engine):
+        expected = [(miles, city) for (miles, city) in get_all_distances(engine, lat, lng) if miles <= radius]
+        assert engine.spatial_index.get_within(lat, lng, radius) == expected
@@ -0,0 +1,58 @@
+#!/usr/local/bin/python3
+# tree_cache.py : LRU cache of shortest path trees
+#
+# A few hub cities are the origin of most queries. Their complete shortest path trees are kept, keyed by
+# (source, cost function), so any later query from them is answered by walking predecessors instead of searching.
+# The cache holds at most budget bytes of trees; the least recently used ones are dropped first.
+#
+
+from collections import OrderedDict
+
+# Bytes per city of a tree: the g cost (8), predecessor edge and city (4 + 4) and settle order (4).
+TREE_BYTES_PER_CITY = 20
+
+class TreeCache:
+    def __init__(self, budget):
+        self.budget = budget
+        self.trees = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.trees)
+
+    def get(self, key):
+        if key not in self.trees:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.trees.move_to_end(key)
+        return self.trees[key][0]
+
+    # Like get(), but leaves the counters and the LRU order alone, for lookups that aren't route queries.
+    def peek(self, key):
+        entry = self.trees.get(key)
+        return entry[0] if entry is not None else None
+
+    def put(self, key, tree, cities):
+        size = cities * TREE_BYTES_PER_CITY
+        if size > self.budget:
+            return
+        if key in self.trees:
+            self.size -= self.trees.pop(key)[1]
+        self.trees[key] = (tree, size)
+        self.size += size
+        while self.size > self.budget:
+            (_, (_, evicted)) = self.trees.popitem(last=False)
+            self.size -= evicted
+            self.evictions += 1
+
+    def clear(self):
+        self.trees.clear()
+        self.size = 0
+
+    def get_stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "trees": len(self.trees),
+                "bytes": self.size}